@@ -1,5 +1,6 @@
 from enum import Enum
 from abc import ABC, abstractmethod
+from types import GeneratorType
 
 class NodeType(Enum):
     PROGRAM = "PROGRAM"
@@ -17,6 +18,7 @@ class NodeType(Enum):
     BREAK_STATEMENT = "BREAK_STATEMENT"
     CONTINUE_STATEMENT = "CONTINUE_STATEMENT"
     IMPORT_STATEMENT = "IMPORT_STATEMENT"
+    MATCH_STATEMENT = "MATCH_STATEMENT"
 
     # expressions
     INFIX_EXPRESSION = "INFIXEXPRESSION"
@@ -32,365 +34,403 @@ class NodeType(Enum):
 
     #help
     DEF_PARAM = "DEF_PARAM"
+    LOOP_HINT = "LOOP_HINT"
+    MATCH_CASE = "MATCH_CASE"
 
 class Node(ABC):
-    @abstractmethod
+    # nodes are slotted, no __dict__ per node, and every class says what it is in kind
+    __slots__ = ()
+    kind: NodeType
+
     def type_(self) -> NodeType:
-        pass
+        return self.kind
 
     @abstractmethod
-    def json(self):
+    def json_fields(self) -> list[tuple[str, object]]:
+        # (key, value) pairs in output order, values are plain values, nodes, lists or dicts of those
         pass
 
+    def json(self):
+        return {key: json_value(value) for key, value in self.json_fields()}
+
+
+def json_value(value):
+    if isinstance(value, Node):
+        return value.json()
+    if isinstance(value, dict):
+        return {key: json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, GeneratorType)):
+        return [json_value(item) for item in value]
+    return value
+
+
+def iter_children(node: Node):
+    # the nodes right under node, in field order, straight off the slots
+    for field in type(node).__slots__:
+        value = getattr(node, field)
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+
+
+def walk(node: Node):
+    # every node under node and node itself, parents first, no recursion
+    stack: list[Node] = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = list(iter_children(node))
+        children.reverse()
+        stack.extend(children)
+
+
+def count_nodes(node: Node) -> int:
+    return sum(1 for _ in walk(node))
+
 
 class Statement(Node):
-    pass
+    __slots__ = ()
 
 class Expression(Node):
-    pass
+    __slots__ = ()
 
 class Program(Node):
+    kind = NodeType.PROGRAM
+    __slots__ = ("statements",)
+
     def __init__(self):
         self.statements: list[Statement] = []
 
-    def type_(self):
-        return NodeType.PROGRAM
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "statements": [{stm.type_().value: stm.json()} for stm in self.statements]
-        }
+    def json_fields(self):
+        return [
+            ("type", self.kind.value),
+            # a generator so streaming writers never hold a list of all the wrappers
+            ("statements", ({stm.kind.value: stm} for stm in self.statements)),
+        ]
 
 # help
 
 class DefParam(Expression):
+    kind = NodeType.DEF_PARAM
+    __slots__ = ("name", "val_type")
+
     def __init__(self, name: str = None, val_type: str = None):
         self.name = name
         self.val_type = val_type
 
-    def type_(self):
-        return NodeType.DEF_PARAM
-    
-    def json(self):
-        return{
-            "type": self.type_().value,
-            "name": self.name,
-            "val_type": self.val_type
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("name", self.name), ("val_type", self.val_type)]
+
+class LoopHint(Expression):
+    # @unroll(4) and friends in front of a loop, value is the number in the parens if there is one
+    kind = NodeType.LOOP_HINT
+    __slots__ = ("name", "value")
+
+    def __init__(self, name: str = None, value: int = None):
+        self.name = name
+        self.value = value
+
+    def json_fields(self):
+        return [("type", self.kind.value), ("name", self.name), ("value", self.value)]
+
+class MatchCase(Node):
+    # case 1, 2 { ... } inside a match, the values are int constants
+    kind = NodeType.MATCH_CASE
+    __slots__ = ("values", "block")
+
+    def __init__(self, values: list[Expression] = None, block: "BlockStatement" = None):
+        self.values = values if values is not None else []
+        self.block = block
+
+    def json_fields(self):
+        return [("type", self.kind.value), ("values", self.values), ("block", self.block)]
 
 # statements
 
 class ExpressionStatement(Statement):
+    kind = NodeType.EXPRESSION_STATEMENT
+    __slots__ = ("expr",)
+
     def __init__(self, expr: Expression = None):
         self.expr = expr
 
-    def type_(self):
-        return NodeType.EXPRESSION_STATEMENT
-    
-    def json(self):
-        return {
-            "type" : self.type_().value,
-            "json" : self.expr.json()
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("json", self.expr)]
 
     
 class VarStatement(Statement):
+    kind = NodeType.VAR_STATEMENT
+    __slots__ = ("name", "value", "value_type")
+
     def __init__(self, name: Expression = None, value: Expression = None, value_type:str = None):
         self.name = name
         self.value = value
         self.value_type = value_type
 
-    def type_(self):
-        return NodeType.VAR_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "name": self.name.json(),
-            "value": self.value.json(),
-            "value_type": self.value_type
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("name", self.name), ("value", self.value), ("value_type", self.value_type)]
     
 
 class BlockStatement(Statement):
+    kind = NodeType.BLOCK_STATEMENT
+    __slots__ = ("statements",)
+
     def __init__(self, statements: list[Statement] = None):
         self.statements = statements if statements is not None else []
 
-    def type_(self):
-        return NodeType.BLOCK_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "statements": [stm.json() for stm in self.statements]
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("statements", self.statements)]
     
 
 class ReturnStatement(Statement):
+    kind = NodeType.RETURN_STATEMENT
+    __slots__ = ("ret_value",)
+
     def __init__(self, ret_value: Expression = None):
         self.ret_value = ret_value
 
-    def type_(self):
-        return NodeType.RETURN_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "ret_value": self.ret_value.json()
-
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("ret_value", self.ret_value)]
 
 
 class DefStatement(Statement):
-    def __init__(self, name = None, params:list[DefParam] = None, ret_type:str = None, block: BlockStatement = None):
+    kind = NodeType.DEF_STATEMENT
+    __slots__ = ("name", "params", "block", "ret_type", "exported", "fastmath")
+
+    def __init__(self, name = None, params:list[DefParam] = None, ret_type:str = None, block: BlockStatement = None, exported: bool = False,
+                 fastmath: bool = False):
         self.name = name
         self.params = params
         self.block = block
         self.ret_type = ret_type
-
-    def type_(self):
-        return NodeType.DEF_STATEMENT
-    
-    def json(self):
-
-        return {
-            "type": self.type_().value,
-            "name": self.name.json(),
-            "params": [p.json() for p in self.params],
-            "ret_type": self.ret_type,
-            "block": self.block.json()
-        }
+        self.exported = exported # export def, keeps the C ABI and its name visible outside the module
+        self.fastmath = fastmath # @fastmath def, its float math may be reassociated and assume no NaNs/infs
+
+    def json_fields(self):
+        fields = [
+            ("type", self.kind.value),
+            ("name", self.name),
+            ("params", self.params),
+            ("ret_type", self.ret_type),
+            ("block", self.block),
+        ]
+        if self.exported:
+            fields.append(("exported", True))
+        if self.fastmath:
+            fields.append(("fastmath", True))
+        return fields
     
 
 class AssignmentStatement(Statement):
+    kind = NodeType.ASSIGNMENT_STATEMENT
+    __slots__ = ("iden", "new_value", "op")
+
     def __init__(self, iden: Expression = None, new_value: Expression = None, op:str = ""):
         self.iden = iden
         self.new_value = new_value
         self.op = ""
 
-    def type_(self):
-        return NodeType.ASSIGNMENT_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "identifier": self.iden.json(),
-            "new_vlaue": self.new_value.json()
-
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("identifier", self.iden), ("new_vlaue", self.new_value)]
 
 
 class IfStatement(Statement):
+    kind = NodeType.IF_STATEMENT
+    __slots__ = ("condition", "true_block", "else_block")
+
     def __init__(self, condition: Expression = None, true_block: BlockStatement = None, else_block: BlockStatement = None):
         self.condition = condition
         self.true_block = true_block
         self.else_block = else_block
 
-    def type_(self):
-        return NodeType.IF_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "condition": self.condition.json(),
-            "true_block": self.true_block.json(),
-            "else_block": self.else_block.json() if self.else_block is not None else ""
-        }
+    def json_fields(self):
+        return [
+            ("type", self.kind.value),
+            ("condition", self.condition),
+            ("true_block", self.true_block),
+            ("else_block", self.else_block if self.else_block is not None else ""),
+        ]
     
 
 class WhileStatement(Statement):
-    def __init__(self, condition: Expression = None, block: BlockStatement = None):
+    kind = NodeType.WHILE_STATEMENT
+    __slots__ = ("condition", "block", "hints")
+
+    def __init__(self, condition: Expression = None, block: BlockStatement = None, hints: list[LoopHint] = None):
         self.condition = condition
         self.block = block 
+        self.hints = hints if hints is not None else []
     
-    def type_(self):
-        return NodeType.WHILE_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "condition": self.condition.json(),
-            "block": self.block.json()
-        }
+    def json_fields(self):
+        fields = [("type", self.kind.value), ("condition", self.condition), ("block", self.block)]
+        if self.hints:
+            fields.append(("hints", self.hints))
+        return fields
         
         
 class BreakStatement(Statement):
+    kind = NodeType.BREAK_STATEMENT
+    __slots__ = ()
 
-    def type_(self):
-        return NodeType.BREAK_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value
-        }
+    def json_fields(self):
+        return [("type", self.kind.value)]
     
 
 class ContinueStatement(Statement):
+    kind = NodeType.CONTINUE_STATEMENT
+    __slots__ = ()
 
-    def type_(self):
-        return NodeType.CONTINUE_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value
-        }
+    def json_fields(self):
+        return [("type", self.kind.value)]
     
 
 class ForStatement(Statement):
-    def __init__(self, var_declaration: VarStatement = None, condition: Expression = None, op:AssignmentStatement = None, block: BlockStatement= None):
+    kind = NodeType.FOR_STATEMENT
+    __slots__ = ("var_decl", "condition", "op", "block", "hints")
+
+    def __init__(self, var_declaration: VarStatement = None, condition: Expression = None, op:AssignmentStatement = None, block: BlockStatement= None,
+                 hints: list[LoopHint] = None):
         self.var_decl = var_declaration
         self.condition = condition
         self.op = op
         self.block = block
+        self.hints = hints if hints is not None else []
 
-    def type_(self):
-        return NodeType.FOR_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "var_decl": self.var_decl.json(),
-            "condition": self.condition.json(),
-            "operation": self.op.json(),
-            "block": self.block.json()
-        }
+    def json_fields(self):
+        fields = [
+            ("type", self.kind.value),
+            ("var_decl", self.var_decl),
+            ("condition", self.condition),
+            ("operation", self.op),
+            ("block", self.block),
+        ]
+        if self.hints:
+            fields.append(("hints", self.hints))
+        return fields
     
 
 class ImportStatement(Statement):
+    kind = NodeType.IMPORT_STATEMENT
+    __slots__ = ("file_path",)
+
     def __init__(self, file_path:str = ""):
         self.file_path = file_path
 
-    def type_(self):
-        return NodeType.IMPORT_STATEMENT
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "file_path": self.file_path
+    def json_fields(self):
+        return [("type", self.kind.value), ("file_path", self.file_path)]
+
+
+class MatchStatement(Statement):
+    kind = NodeType.MATCH_STATEMENT
+    __slots__ = ("subject", "cases", "default")
 
-        }
+    def __init__(self, subject: Expression = None, cases: list[MatchCase] = None, default: BlockStatement = None):
+        self.subject = subject
+        self.cases = cases if cases is not None else []
+        self.default = default
+
+    def json_fields(self):
+        return [
+            ("type", self.kind.value),
+            ("subject", self.subject),
+            ("cases", self.cases),
+            ("default", self.default if self.default is not None else ""),
+        ]
         
 
 
 # expressions
 class InfixExpression(Expression):
+    kind = NodeType.INFIX_EXPRESSION
+    __slots__ = ("l_node", "op", "r_node")
+
     def __init__(self, l_node: Expression, op: str, r_node: Expression = None):
         self.l_node: Expression = l_node
         self.op: str = op
         self.r_node: Expression = r_node
 
-    def type_(self):
-        return NodeType.INFIX_EXPRESSION
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "left_node": self.l_node.json(),
-            "operator": self.op,
-            "r_node": self.r_node.json()
-
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("left_node", self.l_node), ("operator", self.op), ("r_node", self.r_node)]
     
 
 class CallExpression(Expression):
+    kind = NodeType.CALL_EXPRESSION
+    __slots__ = ("def_", "args")
+
     def __init__(self, def_: Expression = None, args: list[Expression] = None):
         self.def_ = def_
         self.args = args
 
-    def type_(self):
-        return NodeType.CALL_EXPRESSION
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "def": self.def_.json(),
-            "args": [arg.json() for arg in self.args]
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("def", self.def_), ("args", self.args)]
     
 
 class PrefixExpression(Expression):
+    kind = NodeType.PREFIX_EXPRESSION
+    __slots__ = ("op", "r_node")
+
     def __init__(self, op: str = None, r_node: Expression = None):
         self.op = op
         self.r_node = r_node
 
-    def type_(self):
-        return NodeType.PREFIX_EXPRESSION
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "operation": self.op,
-            "r_node": self.r_node.json()
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("operation", self.op), ("r_node", self.r_node)]
 
         
 # literals
 class IntLiteral(Expression):
+    kind = NodeType.INT_LITERAL
+    __slots__ = ("int",)
+
     def __init__(self, value: int = None):
         self.int: int = value
 
-    def type_(self):
-        return NodeType.INT_LITERAL
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "value": self.int
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("value", self.int)]
 
 
 class FloatLiteral(Expression):
+    kind = NodeType.FLOAT_LITERAL
+    __slots__ = ("float",)
+
     def __init__(self, value: float = None):
         self.float: float = value
 
-    def type_(self):
-        return NodeType.FLOAT_LITERAL
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "value": self.float
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("value", self.float)]
     
 
 class IdentifierLiteral(Expression):
+    kind = NodeType.INDENTIFIER_LITERAL
+    __slots__ = ("value",)
+
     def __init__(self, value: str = None):
         self.value: str = value
 
-    def type_(self):
-        return NodeType.INDENTIFIER_LITERAL
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "value": self.value
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("value", self.value)]
         
 
 class BoolLiteral(Expression):
+    kind = NodeType.BOOL_LITERAL
+    __slots__ = ("value",)
+
     def __init__(self, value: bool = None):
         self.value: bool = value
 
-    def type_(self):
-        return NodeType.BOOL_LITERAL
-    
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "value": self.value
-        }
+    def json_fields(self):
+        return [("type", self.kind.value), ("value", self.value)]
     
 
 class StringLiteral(Expression):
+    kind = NodeType.STRING_LITERAL
+    __slots__ = ("value",)
+
     def __init__(self, value: str = None):
         self.value: str = value
 
-    def type_(self):
-        return NodeType.STRING_LITERAL
-
-    def json(self):
-        return {
-            "type": self.type_().value,
-            "value": self.value
-        }        
\ No newline at end of file
+    def json_fields(self):
+        return [("type", self.kind.value), ("value", self.value)]
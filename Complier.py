@@ -1,19 +1,24 @@
 from llvmlite import ir
+from typing import Callable
 
-from AST import Node, NodeType, Statement, Expression, Program
-from AST import ExpressionStatement, VarStatement, ReturnStatement, BlockStatement, DefStatement, AssignmentStatement, IfStatement, WhileStatement, ForStatement, BreakStatement, ContinueStatement, ImportStatement
+from AST import Node, NodeType, Statement, Expression, Program, walk
+from AST import ExpressionStatement, VarStatement, ReturnStatement, BlockStatement, DefStatement, AssignmentStatement, IfStatement, WhileStatement, ForStatement, BreakStatement, ContinueStatement, ImportStatement, MatchStatement
 from AST import InfixExpression, CallExpression, PrefixExpression
-from AST import IntLiteral, FloatLiteral, IdentifierLiteral, BoolLiteral
-from AST import DefParam
+from AST import IntLiteral, FloatLiteral, IdentifierLiteral, BoolLiteral, StringLiteral
+from AST import DefParam, LoopHint
 
 from Enviroment import Enviroment
 import os
 
-from lexer import Lexer
-from parser import Parser
+from frontend import open_file, DEFAULT_LEXER_ENGINE
+from ast_folder import ConstantFolder, power_by_squaring, i32
+from const_eval import ConstEvaluator, NotConstant
+from resolver import Resolver
+from source_file import SourceFile
 
 class Compiler():
-    def __init__(self):
+    def __init__(self, lexer_engine: str = DEFAULT_LEXER_ENGINE, source: SourceFile = None, folder: ConstantFolder = None,
+                 drop_unused: bool = True, const_eval: ConstEvaluator = None, fast_math: bool = False):
         self.type_map: dict[str, ir.Type] = {
             "int": ir.IntType(32),
             "float": ir.FloatType(),
@@ -26,16 +31,95 @@ class Compiler():
 
         self.module: ir.Module = ir.Module("main")
         self.builder: ir.IRBuilder = ir.IRBuilder()
+        # sits right before the branch out of the current def's entry block, every stack slot goes there
+        self.alloca_builder: ir.IRBuilder | None = None
+        # defs, builtins and the other names that aren't locals, looked up by name
         self.env: Enviroment = Enviroment()
+        # locals of the def being compiled: the resolver gives every identifier its (depth, slot) up front
+        # and frames[depth][slot] is its (ptr, type), one list per open scope
+        self.resolver: Resolver = Resolver()
+        self.bindings: dict[IdentifierLiteral, tuple[int, int]] = {}
+        self.scope_sizes: dict[Node, int] = {}
+        self.frames: list[list[tuple[ir.Value, ir.Type] | None]] = []
         self.errors: list[str] = []
         self.counter = 0
+        # one global per distinct constant in the whole module, imports included, keyed by its IR text
+        self.constant_pool: dict[str, ir.GlobalVariable] = {}
         self.__initialize_builtins()
 
-        self.breaks: list[ir.Block] = []
-        self.continues: list[ir.Block] = []
-        self.conditions = []
-        self.ops = []
-        self.global_imports: dict[str, Program] = {}
+        self.breaks: list[ir.Block] = [] # exit block of every loop we're in
+        self.dead_ends: set[ir.Block] = set() # end blocks of matches where every case jumped out
+        self.continues: list[ir.Block] = [] # and its latch
+        self.global_imports: set[str] = set()
+        self.lexer_engine = lexer_engine
+        self.source: SourceFile | None = source # file currently being compiled, for error messages
+        self.folder: ConstantFolder | None = folder # imported files get folded with it too
+        # top level defs other than main and exports wait here until a def that gets compiled calls them,
+        # whatever is still here at the end is unreachable and never gets any code
+        self.drop_unused: bool = drop_unused
+        self.pending_defs: dict[str, tuple[DefStatement, Enviroment, SourceFile | None]] = {}
+        # pending defs that got called, but every such call was evaluated at compile time
+        self.evaluated_defs: set[str] = set()
+        # calls to pure defs with constant args become the constant, looked at once per call node
+        self.const_eval: ConstEvaluator | None = const_eval
+        self.const_calls: dict[CallExpression, tuple[ir.Constant, ir.Type] | None] = {}
+        # fast-math for every def, or only for @fastmath ones. fp_flags go on every float op of the
+        # def being compiled: "fast" lets LLVM reassociate (so float reductions vectorize), assume
+        # no NaNs and infs and use faster approximations of the math builtins
+        self.fast_math: bool = fast_math
+        self.fp_flags: tuple[str, ...] = ()
+
+        # dispatch on node.kind, a dict lookup instead of walking a match over the whole NodeType enum
+        self.compile_fns: dict[NodeType, Callable] = {
+            NodeType.PROGRAM: self.__visit_program,
+            # statements
+            NodeType.EXPRESSION_STATEMENT: self.__visit_expression_statement,
+            NodeType.VAR_STATEMENT: self.__visit_var_statement,
+            NodeType.DEF_STATEMENT: self.__visit_def_statement,
+            NodeType.BLOCK_STATEMENT: self.__visit_block_statement,
+            NodeType.RETURN_STATEMENT: self.__visit_return_statement,
+            NodeType.ASSIGNMENT_STATEMENT: self.__visit_ass_statement,
+            NodeType.IF_STATEMENT: self.__visit_if_statement,
+            NodeType.WHILE_STATEMENT: self.__visit_while_statement,
+            NodeType.FOR_STATEMENT: self.__visit_for_statement,
+            NodeType.BREAK_STATEMENT: self.__visit_break_statement,
+            NodeType.CONTINUE_STATEMENT: self.__visit_continue_statement,
+            NodeType.IMPORT_STATEMENT: self.__visit_import_statement,
+            NodeType.MATCH_STATEMENT: self.__visit_match_statement,
+            # expressions
+            NodeType.INFIX_EXPRESSION: self.__visit_infix_expression,
+            NodeType.CALL_EXPRESSION: self.__visit_call_expression,
+        }
+        self.resolve_fns: dict[NodeType, Callable] = {
+            NodeType.INT_LITERAL: self.__resolve_int_literal,
+            NodeType.FLOAT_LITERAL: self.__resolve_float_literal,
+            NodeType.INDENTIFIER_LITERAL: self.__resolve_identifier,
+            NodeType.BOOL_LITERAL: self.__resolve_bool_literal,
+            NodeType.STRING_LITERAL: self.__resolve_string_literal,
+            # expressions
+            NodeType.INFIX_EXPRESSION: lambda node, value_type: self.__visit_infix_expression(node),
+            NodeType.CALL_EXPRESSION: lambda node, value_type: self.__visit_call_expression(node),
+            NodeType.PREFIX_EXPRESSION: lambda node, value_type: self.__visit_prefix_epxression(node),
+        }
+
+    def unused_defs(self) -> list[str]:
+        return list(self.pending_defs)
+
+    def unused_report(self) -> str:
+        unused: list[str] = self.unused_defs()
+        if not unused:
+            return "dropped 0 defs, every single one is used"
+        evaluated: list[str] = [name for name in unused if name in self.evaluated_defs]
+        uncalled: list[str] = [name for name in unused if name not in self.evaluated_defs]
+        report: list[str] = []
+        if uncalled:
+            report.append(f"nobody calls {', '.join(uncalled)}")
+        if evaluated:
+            report.append(f"every call got evaluated at compile time for {', '.join(evaluated)}")
+        return f"dropped {len(unused)} defs: {'; '.join(report)}"
+
+    def __where(self):
+        return f"{self.source.path}: " if self.source is not None else ""
 
     def __increment_counter(self):
         self.counter += 1
@@ -60,101 +144,257 @@ class Compiler():
             return true_var, false_var
         
         self.env.define("print", __initialize_print(), ir.IntType(32))
+
+        # name -> (type of the args and result, arg count, what it makes out of the args), every one of them
+        # is a single intrinsic or instruction, the intrinsics only get declared when something calls them
+        keep_zero = ir.Constant(ir.IntType(1), 0) # ctlz/cttz of 0 is 32 and abs of INT_MIN is INT_MIN, not poison
+        self.builtins: dict[str, tuple[str, int, Callable]] = {
+            "popcount": ("int", 1, lambda x: self.builder.call(self.__int_intrinsic("ctpop", 1), [x])),
+            "clz": ("int", 1, lambda x: self.builder.call(self.__int_intrinsic("ctlz", 1, 1), [x, keep_zero])),
+            "ctz": ("int", 1, lambda x: self.builder.call(self.__int_intrinsic("cttz", 1, 1), [x, keep_zero])),
+            "bswap": ("int", 1, lambda x: self.builder.call(self.__int_intrinsic("bswap", 1), [x])),
+            # a funnel shift of x with itself is a rotate, the backend makes it one rol/ror
+            "rotl": ("int", 2, lambda x, n: self.builder.call(self.__int_intrinsic("fshl", 3), [x, x, n])),
+            "rotr": ("int", 2, lambda x, n: self.builder.call(self.__int_intrinsic("fshr", 3), [x, x, n])),
+            "min": ("int", 2, lambda a, b: self.builder.call(self.__int_intrinsic("smin", 2), [a, b])),
+            "max": ("int", 2, lambda a, b: self.builder.call(self.__int_intrinsic("smax", 2), [a, b])),
+            "abs": ("int", 1, lambda x: self.builder.call(self.__int_intrinsic("abs", 1, 1), [x, keep_zero])),
+        }
+        # float math, name -> llvm.<intrinsic>.f32 and how many floats it takes. sqrt, fabs, floor and co
+        # are one instruction on x86, exp, log, sin and cos end up as calls into libm
+        float_intrinsics: dict[str, tuple[str, int]] = {
+            "sqrt": ("sqrt", 1),
+            "exp": ("exp", 1),
+            "exp2": ("exp2", 1),
+            "log": ("log", 1),
+            "log2": ("log2", 1),
+            "log10": ("log10", 1),
+            "sin": ("sin", 1),
+            "cos": ("cos", 1),
+            "fabs": ("fabs", 1),
+            "floor": ("floor", 1),
+            "ceil": ("ceil", 1),
+            "trunc": ("trunc", 1),
+            "round": ("round", 1),
+            "fma": ("fma", 3),
+            "fmin": ("minnum", 2),
+            "fmax": ("maxnum", 2),
+        }
+        for name, (intrinsic, arg_count) in float_intrinsics.items():
+            self.builtins[name] = ("float", arg_count, lambda *args, intrinsic=intrinsic: self.builder.call(
+                self.__float_intrinsic(intrinsic, len(args)), list(args), fastmath=self.fp_flags))
         
         true_var, false_var = __initialize_bools()
         self.env.define("true", true_var, true_var.type)
         self.env.define("false", false_var, false_var.type)
 
+    def __pooled_constant(self, constant: ir.Constant, prefix: str) -> ir.GlobalVariable:
+        # the same constant twice anywhere in the module is the same global
+        key: str = str(constant)
+        pooled: ir.GlobalVariable | None = self.constant_pool.get(key)
+        if pooled is None:
+            pooled = ir.GlobalVariable(self.module, constant.type, name=f"{prefix}_{self.__increment_counter()}")
+            pooled.global_constant = True
+            pooled.initializer = constant
+            pooled.linkage = "internal"
+            pooled.unnamed_addr = True # nobody compares their addresses, LLVM may merge them further
+            self.constant_pool[key] = pooled
+        return pooled
+
     def __convert_str(self, string:str):
         string = string.replace("\\n", "\n\0")
         f_string = f"{string}\0"
         c_string = ir.Constant(ir.ArrayType(ir.IntType(8), len(f_string)), bytearray(f_string.encode("utf8")))
 
-        global_str = ir.GlobalVariable(self.module, c_string.type, name=f"__str_{self.__increment_counter()}")
-        global_str.global_constant = True
-        global_str.initializer = c_string
-        global_str.linkage = "internal"
+        global_str = self.__pooled_constant(c_string, "__str")
         return global_str, global_str.type
 
     def __builtin_print(self, params: list[ir.Instruction], ret_type: ir.Type):
         def_,_ = self.env.lookup("print")
-        c_string = self.builder.alloca(ret_type)
-        self.builder.store(params[0], c_string)
-        rest_params = params[1:]
-        if isinstance(params[0], ir.LoadInstr):
-            c_fmt: ir.LoadInstr = params[0]
-            ptr = c_fmt.operands[0]
-            str_val = self.builder.load(ptr)
-            fmt_arg = self.builder.bitcast(str_val, ir.IntType(8).as_pointer())
-            return self.builder.call(def_, [fmt_arg, *rest_params])
-        else:
-            fmt_arg = self.builder.bitcast(self.module.get_global(f"__str_{self.counter}"), ir.IntType(8).as_pointer())
-            return self.builder.call(def_,[fmt_arg, *rest_params])
+        # the format is the pooled string itself or a str var holding a pointer to one, either way it's a pointer already
+        fmt_arg = self.builder.bitcast(params[0], ir.IntType(8).as_pointer())
+        return self.builder.call(def_, [fmt_arg, *params[1:]])
 
 
     def compile(self, node: Node):
-        match node.type_():
-            case NodeType.PROGRAM:
-                self.__visit_program(node)
-            # statements
-            case NodeType.EXPRESSION_STATEMENT:
-                self.__visit_expression_statement(node)
-            case NodeType.VAR_STATEMENT:
-                self.__visit_var_statement(node)
-            case NodeType.DEF_STATEMENT:
-                self.__visit_def_statement(node)
-            case NodeType.BLOCK_STATEMENT:
-                self.__visit_block_statement(node)
-            case NodeType.RETURN_STATEMENT:
-                self.__visit_return_statement(node)
-            case NodeType.ASSIGNMENT_STATEMENT:
-                self.__visit_ass_statement(node)
-            case NodeType.IF_STATEMENT:
-                self.__visit_if_statement(node)
-            case NodeType.WHILE_STATEMENT:
-                self.__visit_while_statement(node)
-            case NodeType.FOR_STATEMENT:
-                self.__visit_for_statement(node)
-            case NodeType.BREAK_STATEMENT:
-                self.__visit_break_statement(node)
-            case NodeType.CONTINUE_STATEMENT:
-                self.__visit_continue_statement(node)
-            case NodeType.IMPORT_STATEMENT:
-                self.__visit_import_statement(node)
-
-            #expressions
-            case NodeType.INFIX_EXPRESSION:
-                self.__visit_infix_expression(node)
-            case NodeType.CALL_EXPRESSION:
-                self.__visit_call_expression(node)
+        compile_fn: Callable | None = self.compile_fns.get(node.kind)
+        if compile_fn is not None:
+            compile_fn(node)
 
     # region helper funcs
+    def __alloca(self, type_: ir.Type) -> ir.AllocaInstr:
+        # slots in the entry block are allocated once per call no matter which loop asks for them,
+        # and mem2reg only promotes those
+        return self.alloca_builder.alloca(type_)
+
+    def __lifetime_marker(self, which: str, ptr: ir.AllocaInstr):
+        name = f"llvm.lifetime.{which}.p0i8"
+        try:
+            marker = self.module.get_global(name)
+        except KeyError:
+            marker_type = ir.FunctionType(ir.VoidType(), [ir.IntType(64), ir.IntType(8).as_pointer()])
+            marker = ir.Function(self.module, marker_type, name)
+        # -1 is the whole slot
+        self.builder.call(marker, [ir.Constant(ir.IntType(64), -1), self.builder.bitcast(ptr, ir.IntType(8).as_pointer())])
+
+    def __power_fn(self, name: str, base_type: ir.Type) -> ir.Function:
+        """
+        oboyudno.ipow / oboyudno.fpowi, base ^ i32 by squaring in a loop, made the
+        first time a power needs one. A negative power is 1 / base^-exp, for ints
+        rounded toward zero like sdiv.
+        """
+        try:
+            return self.module.get_global(name)
+        except KeyError:
+            pass
+        int_type: ir.IntType = self.type_map["int"]
+        fn: ir.Function = ir.Function(self.module, ir.FunctionType(base_type, [base_type, int_type]), name)
+        fn.linkage = "internal"
+        base, exp = fn.args
+        is_float: bool = isinstance(base_type, ir.FloatType)
+        mul: Callable = ir.IRBuilder.fmul if is_float else ir.IRBuilder.mul
+        one: ir.Constant = ir.Constant(base_type, 1.0 if is_float else 1)
+
+        entry, header, body, exit_ = (fn.append_basic_block(n) for n in ("entry", "header", "body", "exit"))
+        builder: ir.IRBuilder = ir.IRBuilder(entry)
+        negative = builder.icmp_signed("<", exp, ir.Constant(int_type, 0))
+        n = builder.select(negative, builder.neg(exp), exp) # INT_MIN stays put, fine as an unsigned count
+        builder.branch(header)
+
+        builder.position_at_end(header)
+        result = builder.phi(base_type)
+        square = builder.phi(base_type)
+        left = builder.phi(int_type)
+        builder.cbranch(builder.icmp_unsigned("!=", left, ir.Constant(int_type, 0)), body, exit_)
+
+        builder.position_at_end(body)
+        odd = builder.trunc(left, ir.IntType(1))
+        next_result = builder.select(odd, mul(builder, result, square), result)
+        next_square = mul(builder, square, square)
+        next_left = builder.lshr(left, ir.Constant(int_type, 1))
+        builder.branch(header)
+
+        result.add_incoming(one, entry)
+        result.add_incoming(next_result, body)
+        square.add_incoming(base, entry)
+        square.add_incoming(next_square, body)
+        left.add_incoming(n, entry)
+        left.add_incoming(next_left, body)
+
+        builder.position_at_end(exit_)
+        if is_float:
+            inverse = builder.fdiv(one, result)
+        else:
+            # only 1 and -1 have an int inverse, everything else rounds to 0
+            unit = builder.or_(builder.icmp_signed("==", base, one), builder.icmp_signed("==", base, ir.Constant(base_type, -1)))
+            inverse = builder.select(unit, result, ir.Constant(base_type, 0))
+        builder.ret(builder.select(negative, inverse, result))
+        return fn
+
+    def __int_intrinsic(self, name: str, arg_count: int, flag_count: int = 0) -> ir.Function:
+        # llvm.<name>.i32 taking arg_count i32s and then flag_count i1s
+        int_type: ir.Type = self.type_map["int"]
+        try:
+            return self.module.get_global(f"llvm.{name}.i32")
+        except KeyError:
+            def_type: ir.FunctionType = ir.FunctionType(int_type, [int_type] * arg_count + [ir.IntType(1)] * flag_count)
+            return ir.Function(self.module, def_type, f"llvm.{name}.i32")
+
+    def __builtin_call(self, name: str, args: list[ir.Value], types: list[ir.Type]):
+        type_name, arg_count, build = self.builtins[name]
+        type_: ir.Type = self.type_map[type_name]
+        if len(args) != arg_count:
+            self.errors.append(f"{self.__where()}{name} takes {arg_count} args, you gave it {len(args)}")
+            return None, None
+        if type_name == "float":
+            # sqrt(2) is fine, the int becomes a float
+            args = [self.builder.sitofp(arg, type_) if arg_type == self.type_map["int"] else arg for arg, arg_type in zip(args, types)]
+            types = [type_] * len(args)
+        if any(arg_type != type_ for arg_type in types):
+            self.errors.append(f"{self.__where()}{name} only does {type_name}s, not {', '.join(str(arg_type) for arg_type in types)}")
+            return None, None
+        return build(*args), type_
+
+    def __float_intrinsic(self, name: str, arg_count: int) -> ir.Function:
+        float_type: ir.Type = self.type_map["float"]
+        try:
+            return self.module.get_global(f"llvm.{name}.f32")
+        except KeyError:
+            return ir.Function(self.module, ir.FunctionType(float_type, [float_type] * arg_count), f"llvm.{name}.f32")
+
+    def __visit_pow(self, left_value: ir.Value, left_type: ir.Type, right_value: ir.Value, right_type: ir.Type):
+        """
+        ^ on ints squares and multiplies, on floats it's llvm.pow, a float to an int
+        power squares and multiplies in float. Constant int powers are unrolled into
+        the multiplies right here, no loop or call at all.
+        """
+        int_type: ir.Type = self.type_map["int"]
+        float_type: ir.Type = self.type_map["float"]
+        if isinstance(left_type, ir.IntType) and isinstance(right_type, ir.FloatType):
+            left_value, left_type = self.builder.sitofp(left_value, float_type), float_type
+        is_float: bool = isinstance(left_type, ir.FloatType)
+        fmul: Callable = lambda a, b: self.builder.fmul(a, b, flags=self.fp_flags)
+
+        if is_float and isinstance(right_type, ir.FloatType):
+            if isinstance(right_value, ir.Constant) and right_value.constant in (1.0, 2.0):
+                # the only float powers multiplies give exactly
+                return power_by_squaring(left_value, int(right_value.constant), fmul), float_type
+            return self.builder.call(self.__float_intrinsic("pow", 2), [left_value, right_value], fastmath=self.fp_flags), float_type
+
+        result_type: ir.Type = float_type if is_float else int_type
+        if isinstance(right_value, ir.Constant) and (i32(right_value.constant) >= 0 or is_float):
+            n: int = i32(right_value.constant)
+            one: ir.Constant = ir.Constant(result_type, 1.0 if is_float else 1)
+            if n == 0:
+                return one, result_type
+            value = power_by_squaring(left_value, abs(n), fmul if is_float else self.builder.mul)
+            return (self.builder.fdiv(one, value, flags=self.fp_flags) if n < 0 else value), result_type
+
+        name: str = "oboyudno.fpowi" if is_float else "oboyudno.ipow"
+        return self.builder.call(self.__power_fn(name, result_type), [left_value, right_value]), result_type
+
+    def __enter_scope(self, node: Node):
+        self.frames.append([None] * self.scope_sizes.get(node, 0))
+
+    def __exit_scope(self):
+        # the slots declared in this scope are dead from here on, unless the block already jumped away
+        frame = self.frames.pop()
+        if not self.builder.block.is_terminated:
+            for local in frame:
+                if local is not None and isinstance(local[0], ir.AllocaInstr):
+                    self.__lifetime_marker("end", local[0])
+
+    def __lookup(self, node: IdentifierLiteral) -> tuple[ir.Value, ir.Type] | None:
+        binding: tuple[int, int] | None = self.bindings.get(node)
+        if binding is None:
+            return self.env.lookup(node.value)
+        depth, slot = binding
+        return self.frames[depth][slot]
+
     def __resolve_value(self, node: Expression, value_type: str = None) -> tuple[ir.Value, ir.Type]:
-        match node.type_():
-            case NodeType.INT_LITERAL:
-                value, type_ = node.int, self.type_map["int" if value_type is None else value_type]
-                return ir.Constant(type_, value), type_
-            case NodeType.FLOAT_LITERAL:
-                value, type_ = node.float, self.type_map["float" if value_type is None else value_type]
-                return ir.Constant(type_, value), type_
-            case NodeType.INDENTIFIER_LITERAL:
-                ptr, type_ = self.env.lookup(node.value)
-                return self.builder.load(ptr), type_
-            case NodeType.BOOL_LITERAL:
-                return ir.Constant(ir.IntType(1), 1 if node.value else 0), ir.IntType(1)
-            case NodeType.STRING_LITERAL:
-                string, type_ = self.__convert_str(node.value)
-                return string, type_
-            
-            # expressions
-            case NodeType.INFIX_EXPRESSION:
-                return self.__visit_infix_expression(node)
-            case NodeType.CALL_EXPRESSION:
-                return self.__visit_call_expression(node)
-            case NodeType.PREFIX_EXPRESSION:
-                return self.__visit_prefix_epxression(node)
+        resolve_fn: Callable | None = self.resolve_fns.get(node.kind)
+        if resolve_fn is None:
+            return None
+        return resolve_fn(node, value_type)
+
+    def __resolve_int_literal(self, node: IntLiteral, value_type: str = None):
+        value, type_ = node.int, self.type_map["int" if value_type is None else value_type]
+        return ir.Constant(type_, value), type_
 
+    def __resolve_float_literal(self, node: FloatLiteral, value_type: str = None):
+        value, type_ = node.float, self.type_map["float" if value_type is None else value_type]
+        return ir.Constant(type_, value), type_
 
+    def __resolve_identifier(self, node: IdentifierLiteral, value_type: str = None):
+        ptr, type_ = self.__lookup(node)
+        return self.builder.load(ptr), type_
+
+    def __resolve_bool_literal(self, node: BoolLiteral, value_type: str = None):
+        return ir.Constant(ir.IntType(1), 1 if node.value else 0), ir.IntType(1)
+
+    def __resolve_string_literal(self, node: StringLiteral, value_type: str = None):
+        string, type_ = self.__convert_str(node.value)
+        return string, type_
 
     # endregion
 
@@ -180,11 +420,58 @@ class Compiler():
     def __visit_expression_statement(self, node: ExpressionStatement):
         self.compile(node.expr)
 
+    def __visit_logical(self, node: InfixExpression):
+        """
+        && and || with real control flow: the right side gets its own block and is
+        only run when the left side didn't already decide, a phi picks the result.
+        """
+        bool_type: ir.IntType = self.type_map["bool"]
+        left_value, left_type = self.__resolve_value(node.l_node)
+        if left_type != bool_type:
+            self.errors.append(f"{self.__where()}{node.op} wants bools on both sides, the left one is {left_type}")
+            return None, None
+
+        is_and: bool = node.op == "&&"
+        n: int = self.__increment_counter()
+        left_end: ir.Block = self.builder.block
+        right_block: ir.Block = self.builder.append_basic_block(f"{'and' if is_and else 'or'}_rhs_{n}")
+        end: ir.Block = self.builder.append_basic_block(f"{'and' if is_and else 'or'}_end_{n}")
+        if is_and:
+            self.builder.cbranch(left_value, right_block, end)
+        else:
+            self.builder.cbranch(left_value, end, right_block)
+
+        self.builder.position_at_end(right_block)
+        right_value, right_type = self.__resolve_value(node.r_node)
+        if right_type != bool_type:
+            self.errors.append(f"{self.__where()}{node.op} wants bools on both sides, the right one is {right_type}")
+            return None, None
+        # the right side may have opened blocks of its own, the phi wants the one it ends in
+        right_end: ir.Block = self.builder.block
+        self.builder.branch(end)
+
+        self.builder.position_at_end(end)
+        result: ir.PhiInstr = self.builder.phi(bool_type)
+        result.add_incoming(ir.Constant(bool_type, 0 if is_and else 1), left_end)
+        result.add_incoming(right_value, right_end)
+        return result, bool_type
+
     def __visit_infix_expression(self, node: InfixExpression):
         op: str = node.op
+        if op == "&&" or op == "||":
+            return self.__visit_logical(node)
         left_value, left_type = self.__resolve_value(node.l_node)
         right_value, right_type = self.__resolve_value(node.r_node)
 
+        if op == "^":
+            return self.__visit_pow(left_value, left_type, right_value, right_type)
+        if op in ("&", "|", "~") and (left_type != right_type or not isinstance(left_type, ir.IntType)):
+            self.errors.append(f"{self.__where()}{op} wants two ints or two bools, got {left_type} and {right_type}")
+            return None, None
+        if op in ("<<", ">>") and (left_type != self.type_map["int"] or right_type != self.type_map["int"]):
+            self.errors.append(f"{self.__where()}{op} only shifts ints by ints, got {left_type} and {right_type}")
+            return None, None
+
         value = None
         type_ = None
         if isinstance(left_type, ir.IntType) and isinstance(right_type, ir.IntType):
@@ -200,9 +487,6 @@ class Compiler():
                     value = self.builder.sdiv(left_value, right_value)
                 case "%":
                     value = self.builder.srem(left_value, right_value)
-                case "^":
-                    # TODO
-                    pass
                 case "<":
                     value = self.builder.icmp_signed("<", left_value, right_value)
                     type_ = ir.IntType(1)
@@ -218,37 +502,50 @@ class Compiler():
                 case "==":
                     value = self.builder.icmp_signed("==", left_value, right_value)
                     type_ = ir.IntType(1)
+                # bit ops on two bools stay bools
+                case "&":
+                    value = self.builder.and_(left_value, right_value)
+                    type_ = left_type
+                case "|":
+                    value = self.builder.or_(left_value, right_value)
+                    type_ = left_type
+                case "~":
+                    value = self.builder.xor(left_value, right_value)
+                    type_ = left_type
+                # the amount is masked to 0..31 so a big one isn't poison, x86 masks it the same way and
+                # the and goes away in the backend
+                case "<<":
+                    value = self.builder.shl(left_value, self.builder.and_(right_value, ir.Constant(right_type, 31)))
+                case ">>":
+                    value = self.builder.ashr(left_value, self.builder.and_(right_value, ir.Constant(right_type, 31)))
                 
         elif isinstance(left_type, ir.FloatType) and isinstance(right_type, ir.FloatType):
             type_ = self.type_map["float"]
             match op:
                 case "+":
-                    value = self.builder.fadd(left_value, right_value)
+                    value = self.builder.fadd(left_value, right_value, flags=self.fp_flags)
                 case "-":
-                    value = self.builder.fsub(left_value, right_value)
+                    value = self.builder.fsub(left_value, right_value, flags=self.fp_flags)
                 case "*":
-                    value = self.builder.fmul(left_value, right_value)
+                    value = self.builder.fmul(left_value, right_value, flags=self.fp_flags)
                 case "/":
-                    value = self.builder.fdiv(left_value, right_value)
+                    value = self.builder.fdiv(left_value, right_value, flags=self.fp_flags)
                 case "%":
-                    value = self.builder.frem(left_value, right_value)
-                case "^":
-                    # TODO
-                    pass
+                    value = self.builder.frem(left_value, right_value, flags=self.fp_flags)
                 case "<":
-                    value = self.builder.fcmp_ordered("<", left_value, right_value)
+                    value = self.builder.fcmp_ordered("<", left_value, right_value, flags=self.fp_flags)
                     type_ = ir.IntType(1)
                 case ">":
-                    value = self.builder.fcmp_ordered(">", left_value, right_value)
+                    value = self.builder.fcmp_ordered(">", left_value, right_value, flags=self.fp_flags)
                     type_ = ir.IntType(1)
                 case "<=":
-                    value = self.builder.fcmp_ordered("<=", left_value, right_value)
+                    value = self.builder.fcmp_ordered("<=", left_value, right_value, flags=self.fp_flags)
                     type_ = ir.IntType(1)
                 case ">=":
-                    value = self.builder.fcmp_ordered(">=", left_value, right_value)
+                    value = self.builder.fcmp_ordered(">=", left_value, right_value, flags=self.fp_flags)
                     type_ = ir.IntType(1)
                 case "==":
-                    value = self.builder.fcmp_ordered("==", left_value, right_value)
+                    value = self.builder.fcmp_ordered("==", left_value, right_value, flags=self.fp_flags)
                     type_ = ir.IntType(1)
 
         return value, type_
@@ -257,28 +554,34 @@ class Compiler():
         self.builder.branch(self.breaks[-1])
 
     def __visit_continue_statement(self, node):
-        test,_ = self.__resolve_value(self.conditions[-1])
-        self.compile(self.ops[-1])
-        self.builder.cbranch(test, self.continues[-1], self.breaks[-1])
+        # the latch does the step and goes back to the one condition in the header
+        self.builder.branch(self.continues[-1])
 
     def __visit_import_statement(self, node: ImportStatement):
         file_path:str = node.file_path
-        if self.global_imports.get(file_path) is not None:
+        if file_path in self.global_imports:
             print(f"file {file_path} is alredy fucking imported like bro actually can you just look at the code \n you ever tried thinking yk like actually this is insane \n you need to change like bro this is not okay")
             return
-        with open(os.path.abspath(f"./{file_path}"), "r") as f:
-            imp_code = f.read()
-        l:Lexer = Lexer(source=imp_code)
-        p:Parser = Parser(lexer=l)
-        program:Program = p.parse_program()
-        if len(p.errors) > 0:
+        # statements get compiled as they are parsed and dropped right after, nothing keeps the program
+        statements, errors, source = open_file(os.path.abspath(f"./{file_path}"), self.lexer_engine)
+        prev_source = self.source
+        self.source = source
+        for stm in statements:
+            if len(errors) > 0:
+                break
+            if self.folder is not None:
+                stm = self.folder.fold(stm)
+                if stm is None:
+                    continue
+            self.compile(stm)
+        if len(errors) > 0:
             print(f"that fucking {file_path} is so ASS")
-            for e in p.errors:
+            for e in errors:
                 print(e)
             exit()
 
-        self.compile(node=program)
-        self.global_imports[file_path] = program
+        self.source = prev_source
+        self.global_imports.add(file_path)
     
     def __visit_for_statement(self, node:ForStatement):
         var_decl: VarStatement = node.var_decl
@@ -286,48 +589,105 @@ class Compiler():
         op: AssignmentStatement = node.op
         block: BlockStatement = node.block
 
-        prev_env = self.env
-        self.evn = Enviroment(parent=prev_env)
+        # the loop variable lives in its own scope around the loop
+        self.__enter_scope(node)
         self.compile(var_decl)
+        back_edge = self.__lower_loop("for", condition, block, op)
+        self.__attach_loop_hints(back_edge, node.hints)
+        self.__exit_scope()
+
+    def __visit_while_statement(self, node: WhileStatement):
+        back_edge = self.__lower_loop("while", node.condition, node.block)
+        self.__attach_loop_hints(back_edge, node.hints)
+
+    def __attach_loop_hints(self, back_edge: ir.Instruction, hints: list[LoopHint]):
+        """
+        Turns @unroll(4) and co into the !llvm.loop metadata on the latch's back
+        edge, which is where LLVM's loop passes look for it.
+        """
+        if not hints:
+            return
+        i32, i1 = ir.IntType(32), ir.IntType(1)
+        properties: list[tuple[str, ir.Constant | None]] = []
+        for hint in hints:
+            match hint.name, hint.value:
+                case "unroll", None:
+                    properties.append(("llvm.loop.unroll.enable", None))
+                case "unroll", count:
+                    properties.append(("llvm.loop.unroll.count", ir.Constant(i32, count)))
+                case "nounroll", _:
+                    properties.append(("llvm.loop.unroll.disable", None))
+                case "vectorize", width:
+                    properties.append(("llvm.loop.vectorize.enable", ir.Constant(i1, 1)))
+                    if width is not None:
+                        properties.append(("llvm.loop.vectorize.width", ir.Constant(i32, width)))
+                case "novectorize", _:
+                    properties.append(("llvm.loop.vectorize.enable", ir.Constant(i1, 0)))
+                case "interleave", count:
+                    properties.append(("llvm.loop.interleave.count", ir.Constant(i32, count)))
+
+        nodes: list[ir.MDValue] = [
+            self.module.add_metadata([ir.MetaDataString(self.module, key)] + ([] if value is None else [value]))
+            for key, value in properties
+        ]
+        # the loop id has to be its own first operand and unique per loop, so no add_metadata and its cache here
+        loop_id: ir.MDValue = ir.MDValue(self.module, [], name=str(len(self.module.metadata)))
+        loop_id.operands = (loop_id, *nodes)
+        back_edge.set_metadata("llvm.loop", loop_id)
+
+    def __lower_loop(self, name: str, condition: Expression, block: BlockStatement, step: Statement = None) -> ir.Instruction:
+        """
+        Every loop comes out in the shape LLVM's loop passes look for:
+        header (the condition, only place it's evaluated) -> body -> latch (the step,
+        continue lands here) -> back to the header, and exit where the header or a
+        break leaves to. Returns the latch's back edge.
+        """
+        n: int = self.__increment_counter()
+        header: ir.Block = self.builder.append_basic_block(f"{name}_header_{n}")
+        body: ir.Block = self.builder.append_basic_block(f"{name}_body_{n}")
+        latch: ir.Block = self.builder.append_basic_block(f"{name}_latch_{n}")
+        exit_: ir.Block = self.builder.append_basic_block(f"{name}_exit_{n}")
+
+        self.builder.branch(header)
+        self.builder.position_at_end(header)
+        test, _ = self.__resolve_value(condition)
+        self.builder.cbranch(test, body, exit_)
 
-        for_entr = self.builder.append_basic_block(f"for_entr_{self.__increment_counter()}")
-        for_other = self.builder.append_basic_block(f"for_other_{self.__increment_counter()}")
-        self.breaks.append(for_other)
-        self.continues.append(for_entr) # not working TODO
-        self.conditions.append(condition)
-        self.ops.append(op)
-
-        self.builder.branch(for_entr)
-        self.builder.position_at_start(for_entr)
+        self.builder.position_at_end(body)
+        self.breaks.append(exit_)
+        self.continues.append(latch)
         self.compile(block)
-        self.compile(op)
-        test,_ = self.__resolve_value(condition)
-        self.builder.cbranch(test, for_entr, for_other)
-        self.builder.position_at_start(for_other)
         self.breaks.pop()
         self.continues.pop()
-        self.conditions.pop()
-        self.ops.pop()
-
+        if not self.builder.block.is_terminated:
+            self.builder.branch(latch)
 
-    
-    def __visit_while_statement(self, node):
-        condition: Expression = node.condition
-        block: BlockStatement = node.block
-        test, _ = self.__resolve_value(condition)
-
-        while_entr = self.builder.append_basic_block(f"while_entry_{self.__increment_counter()}")
-        while_other = self.builder.append_basic_block(f"while_otherwise_{self.counter}")
+        self.builder.position_at_end(latch)
+        if step is not None:
+            self.compile(step)
+        back_edge: ir.Instruction = self.builder.branch(header)
 
-        self.builder.cbranch(test, while_entr, while_other)
-        self.builder.position_at_start(while_entr)
-        self.compile(block)
-        test,_ = self.__resolve_value(condition)
-        self.builder.cbranch(test, while_entr, while_other)
-        self.builder.position_at_start(while_other)
+        self.builder.position_at_end(exit_)
+        return back_edge
     
-    def __visit_call_expression(self, node: CallExpression):
+    def __const_call(self, node: CallExpression) -> tuple[ir.Constant, ir.Type] | None:
+        if self.const_eval is None:
+            return None
+        if node not in self.const_calls:
+            try:
+                value = self.const_eval.evaluate(node)
+            except NotConstant:
+                self.const_calls[node] = None
+            else:
+                type_: ir.Type = self.type_map[self.const_eval.return_type(node.def_.value)]
+                self.const_calls[node] = ir.Constant(type_, int(value) if isinstance(value, bool) else value), type_
+        return self.const_calls[node]
+
+    def __visit_call_expression(self, node: CallExpression, tail: bool = False):
         name: str = node.def_.value
+        const = self.__const_call(node)
+        if const is not None:
+            return const
         params: list[Expression] = node.args
         args = []
         types = []
@@ -341,9 +701,12 @@ class Compiler():
             case "print":
                 out = self.__builtin_print(params=args, ret_type=types[0])
                 ret_type = self.type_map["int"]
+            case _ if name in self.builtins and self.env.lookup(name) is None:
+                # a def of your own with the same name wins
+                out, ret_type = self.__builtin_call(name, args, types)
             case _:
                 def_, ret_type = self.env.lookup(name)
-                out = self.builder.call(def_, args)
+                out = self.builder.call(def_, args, cconv=def_.calling_convention or None, tail=tail)
 
         return out, ret_type
     
@@ -358,7 +721,7 @@ class Compiler():
             Type = ir.FloatType()
             match op:
                 case "-":
-                    Value = self.builder.fmul(r_val, ir.Constant(ir.FloatType(), -1.0))
+                    Value = self.builder.fmul(r_val, ir.Constant(ir.FloatType(), -1.0), flags=self.fp_flags)
                 case "!":
                     Value = ir.Constant(ir.IntType(1), 0)
         elif isinstance(r_type, ir.IntType):
@@ -367,7 +730,9 @@ class Compiler():
                 case "-":
                     Value = self.builder.mul(r_val, ir.Constant(ir.IntType(32), -1))
                 case "!":
+                    # flips every bit of whatever it got, a bool stays a bool
                     Value = self.builder.not_(r_val)
+                    Type = r_type
         return Value, Type
     
     def __visit_var_statement(self, node:VarStatement):
@@ -376,22 +741,34 @@ class Compiler():
         value_type: str = node.value_type # TODO
 
         value, type_ = self.__resolve_value(node=value, value_type=value_type)
+        if type_ is None:
+            # the value already put its error in self.errors
+            return
 
-        if self.env.lookup(name) is None:
-            ptr = self.builder.alloca(type_)
+        depth, slot = self.bindings[node.name]
+        local: tuple[ir.Value, ir.Type] | None = self.frames[depth][slot]
+        if local is None:
+            ptr = self.__alloca(type_)
+            self.__lifetime_marker("start", ptr)
             self.builder.store(value,ptr)
-            self.env.define(name, ptr, type_)
+            self.frames[depth][slot] = (ptr, type_)
         else:
-            ptr, _ = self.env.lookup(name)
+            ptr, _ = local
             self.builder.store(value, ptr)
 
     def __visit_block_statement(self, node: BlockStatement):
+        self.__enter_scope(node)
         for stm in node.statements:
             self.compile(stm)
+        self.__exit_scope()
 
     def __visit_return_statement(self, node:ReturnStatement):
         value: Expression = node.ret_value
-        value, type_ = self.__resolve_value(value)
+        if value.kind == NodeType.CALL_EXPRESSION:
+            # nothing happens after the call, LLVM can jump instead of call and reuse our frame
+            value, type_ = self.__visit_call_expression(value, tail=True)
+        else:
+            value, type_ = self.__resolve_value(value)
 
         self.builder.ret(value)
     
@@ -401,11 +778,12 @@ class Compiler():
         new_value: Expression = node.new_value
 
         
-        if self.env.lookup(name) is None:
-            self.errors.append(f"bro you forgot to declare {name} before re-ASSinging it")
+        local: tuple[ir.Value, ir.Type] | None = self.__lookup(node.iden)
+        if local is None:
+            self.errors.append(f"{self.__where()}bro you forgot to declare {name} before re-ASSinging it")
             return
         new_value, type_ = self.__resolve_value(new_value)
-        val_ptr, _ = self.env.lookup(name)
+        val_ptr, _ = local
         orig_val = self.builder.load(val_ptr)
 
         if isinstance(orig_val, ir.IntType) and isinstance(new_value, ir.FloatType):
@@ -423,27 +801,26 @@ class Compiler():
                 if isinstance(orig_val.type, ir.IntType) and isinstance(new_value.type, ir.IntType):
                     value = self.builder.add(orig_val, new_value)
                 else:
-                    value = self.builder.fadd(orig_val, new_value)
+                    value = self.builder.fadd(orig_val, new_value, flags=self.fp_flags)
             case "-=":
                 if isinstance(orig_val.type, ir.IntType) and isinstance(new_value.type, ir.IntType):
                     value = self.builder.sub(orig_val, new_value)
                 else:
-                    value = self.builder.fsub(orig_val, new_value)
+                    value = self.builder.fsub(orig_val, new_value, flags=self.fp_flags)
             case "*=":
                 if isinstance(orig_val.type, ir.IntType) and isinstance(new_value.type, ir.IntType):
                     value = self.builder.mul(orig_val, new_value)
                 else:
-                    value = self.builder.fmul(orig_val, new_value)
+                    value = self.builder.fmul(orig_val, new_value, flags=self.fp_flags)
             case "/=":
                 if isinstance(orig_val.type, ir.IntType) and isinstance(new_value.type, ir.IntType):
                     value = self.builder.sdiv(orig_val, new_value)
                 else:
-                    value = self.builder.fdiv(orig_val, new_value)
+                    value = self.builder.fdiv(orig_val, new_value, flags=self.fp_flags)
             case _:
                 print("this ass operator is NOT supported")
 
-        ptr,_ = self.env.lookup(name)
-        self.builder.store(value, ptr)
+        self.builder.store(value, val_ptr)
 
     def __visit_if_statement(self, node: IfStatement):
         condition = node.condition
@@ -466,40 +843,148 @@ class Compiler():
 
 
 
+    def __case_value(self, value: Expression) -> int | None:
+        # case labels have to be int constants, -1 or 2 * 8 are fine too even with folding off
+        if value.kind != NodeType.INT_LITERAL:
+            value = ConstantFolder().fold(value)
+        if value.kind != NodeType.INT_LITERAL:
+            return None
+        return i32(value.int)
+
+    def __visit_match_statement(self, node: MatchStatement):
+        """
+        One LLVM switch on the subject, the backend turns dense cases into a jump
+        table and sparse ones into a binary search, either way no chain of compares.
+        Cases don't fall through, break and continue still mean the loop around it.
+        """
+        subject, subject_type = self.__resolve_value(node.subject)
+        if subject_type != self.type_map["int"]:
+            self.errors.append(f"{self.__where()}you can only match on an int, not on {subject_type}")
+            return
+
+        labels: list[list[int]] = []
+        seen: set[int] = set()
+        for case in node.cases:
+            labels.append([])
+            for value in case.values:
+                label: int | None = self.__case_value(value)
+                if label is None:
+                    self.errors.append(f"{self.__where()}case values have to be int constants you know that right")
+                    return
+                if label in seen:
+                    self.errors.append(f"{self.__where()}case {label} is in this match twice, pick one")
+                    return
+                seen.add(label)
+                labels[-1].append(label)
+
+        n: int = self.__increment_counter()
+        case_blocks: list[ir.Block] = [self.builder.append_basic_block(f"match_case_{n}_{i}") for i in range(len(node.cases))]
+        default: ir.Block | None = self.builder.append_basic_block(f"match_default_{n}") if node.default is not None else None
+        end: ir.Block = self.builder.append_basic_block(f"match_end_{n}")
+        switch: ir.SwitchInstr = self.builder.switch(subject, default if default is not None else end)
+        for case_block, case_labels in zip(case_blocks, labels):
+            for label in case_labels:
+                switch.add_case(ir.Constant(subject_type, label), case_block)
+
+        reaches_end: bool = default is None
+        for case_block, block in [*zip(case_blocks, (case.block for case in node.cases)), (default, node.default)]:
+            if case_block is None:
+                continue
+            self.builder.position_at_end(case_block)
+            self.compile(block)
+            if not self.builder.block.is_terminated:
+                self.builder.branch(end)
+                reaches_end = True
+
+        self.builder.position_at_end(end)
+        if not reaches_end:
+            # every case returned, nothing ever gets here. It stays open like the end of an if/else so
+            # whatever comes after the match still has somewhere to go, __compile_def closes it if nothing does
+            self.dead_ends.add(end)
+
     def __visit_def_statement(self, node:DefStatement):
+        name: str = node.name.value
+        top_level: bool = self.alloca_builder is None
+        if top_level and self.const_eval is not None:
+            self.const_eval.define(node)
+        if self.drop_unused and top_level and name != "main" and not node.exported:
+            self.pending_defs[name] = (node, self.env, self.source)
+            return
+        self.__compile_def(node)
+        if top_level:
+            self.const_calls.clear()
+
+    def __compile_callees(self, node: Node):
+        # main, exports and whatever they call get compiled, walking down the call graph before any code of node
+        for child in walk(node):
+            if child.kind != NodeType.CALL_EXPRESSION or child.def_.value not in self.pending_defs:
+                continue
+            if self.__const_call(child) is not None:
+                # this call won't call anything at runtime
+                self.evaluated_defs.add(child.def_.value)
+                continue
+            pending = self.pending_defs.pop(child.def_.value, None)
+            if pending is None:
+                continue
+            callee, env, source = pending
+            prev_env, prev_source = self.env, self.source
+            self.env, self.source = env, source
+            self.__compile_def(callee)
+            self.env, self.source = prev_env, prev_source
+
+    def __compile_def(self, node: DefStatement):
         name:str = node.name.value
         block: BlockStatement = node.block
         params: list[DefParam] = node.params
-        param_names: list[str] = [p.name for p in params]
         param_types: list[ir.Type] = [self.type_map[p.val_type] for p in params] 
         ret_type: ir.Type = self.type_map[node.ret_type]
         
         def_type: ir.FunctionType = ir.FunctionType(ret_type, param_types)
         def_: ir.Function = ir.Function(self.module, def_type, name)
+        if name != "main" and not node.exported:
+            # nobody outside the module can call it, so LLVM may inline it, drop it or change how it's called
+            def_.linkage = "internal"
+            def_.calling_convention = "fastcc"
+        # callees that call back into this one (is_even <-> is_odd) have to find it before it has a body
+        self.env.define(name, def_, ret_type)
+        if self.drop_unused:
+            self.__compile_callees(node.block)
 
+        # the entry block only has the stack slots and jumps to the body, the code goes in the body
         ir_block: ir.Block = def_.append_basic_block(f"{name}_entry")
+        body_block: ir.Block = def_.append_basic_block(f"{name}_body")
         prev_builder = self.builder
+        prev_alloca_builder = self.alloca_builder
         prev_env = self.env
-
-        self.builder = ir.IRBuilder(ir_block)
+        prev_fp_flags = self.fp_flags
+        prev_bindings, prev_scope_sizes, prev_frames = self.bindings, self.scope_sizes, self.frames
+        self.bindings, self.scope_sizes = self.resolver.resolve(node)
+        self.fp_flags = ("fast",) if self.fast_math or node.fastmath else ()
+
+        self.alloca_builder = ir.IRBuilder(ir_block)
+        self.alloca_builder.position_before(self.alloca_builder.branch(body_block))
+        self.builder = ir.IRBuilder(body_block)
         param_ptr = []
         for i,t in enumerate(param_types):
-            ptr = self.builder.alloca(t)
-            self.builder.store(def_.args[i], ptr)
+            ptr = self.__alloca(t)
+            self.alloca_builder.store(def_.args[i], ptr)
             param_ptr.append(ptr)
 
-        self.env = Enviroment(parent=prev_env)   
-
-        for i,arg in enumerate(zip(param_types, param_names)):
-            t = param_types[i]
-            ptr = param_ptr[i]
-            self.env.define(arg[1], ptr, t)
+        # the params are the def's own scope, its name goes in an env so it can call itself
+        self.frames = [list(zip(param_ptr, param_types))]
+        self.env = Enviroment(parent=prev_env)
         self.env.define(name, def_, ret_type)
         self.compile(block)
+        if not self.builder.block.is_terminated and self.builder.block in self.dead_ends:
+            # the def ends in a match that always returns, its end block still needs a terminator
+            self.builder.unreachable()
 
         self.env = prev_env
         self.env.define(name, def_, ret_type)
         self.builder = prev_builder
+        self.alloca_builder = prev_alloca_builder
+        self.fp_flags = prev_fp_flags
+        self.bindings, self.scope_sizes, self.frames = prev_bindings, prev_scope_sizes, prev_frames
         
 
 
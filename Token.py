@@ -20,6 +20,13 @@ class TokenType(Enum):
     POW = "POW"
     PERCENT = "PERCENT"
 
+    # bits
+    BIT_AND = "&"
+    BIT_OR = "|"
+    XOR = "~"
+    SHL = "<<"
+    SHR = ">>"
+
     #assigmenty symbols
     EQ = "EQ"
     PLUS_EQ = "PLUS_EQ"
@@ -34,6 +41,8 @@ class TokenType(Enum):
     GREATER_EQ = ">="
     LESS_EQ = "<="
     NOT_EQ = "!="
+    AND = "&&"
+    OR = "||"
 
     #symbols
     ARROW = "ARROW"
@@ -45,6 +54,7 @@ class TokenType(Enum):
     LBRACE = "LBRACE"
     RBRACE = "RBRACE"
     NOT = "NOT"
+    AT = "AT"
 
     #key words
     VAR = "VAR"
@@ -59,12 +69,18 @@ class TokenType(Enum):
     BREAK = "BREAK"
     CONTINUE = "CONTINUE"
     IMPORT = "IMPORT"
+    EXPORT = "EXPORT"
+    MATCH = "MATCH"
+    CASE = "CASE"
+    DEFAULT = "DEFAULT"
 
     # type
     TYPE = "TYPE"
 
 
 class Token():
+    __slots__ = ("type", "literal", "row", "place")
+
     def __init__(self, token_type: TokenType, literal: Any, n_row:int, place:int):
         self.type = token_type
         self.literal = literal # the value 
@@ -90,6 +106,11 @@ KEYWORDS: dict[str, TokenType] = {
     "break": TokenType.BREAK,
     "continue": TokenType.CONTINUE,
     "import": TokenType.IMPORT,
+    "export": TokenType.EXPORT,
+    "match": TokenType.MATCH,
+    "switch": TokenType.MATCH,
+    "case": TokenType.CASE,
+    "default": TokenType.DEFAULT,
 
 }
 
@@ -119,6 +140,12 @@ OBOYUDNO_KEYWORDS: dict[str, TokenType] = {
     "fucking_die": TokenType.BREAK,
     "long_live_the_king": TokenType.CONTINUE,
     "get_over_here": TokenType.IMPORT,
+    "sigma": TokenType.EXPORT,
+    "vibe_check": TokenType.MATCH,
+    "its_giving": TokenType.CASE,
+    "whatever": TokenType.DEFAULT,
+    "fr_fr": TokenType.AND,
+    "or_nah": TokenType.OR,
 
 }
 
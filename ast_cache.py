@@ -0,0 +1,240 @@
+import gc
+import marshal
+import os
+from contextlib import contextmanager
+from hashlib import blake2b
+
+import AST
+from AST import Node, Program
+
+# bump on any change to the compiler that should throw old cached ASTs away, new keywords
+# too: a file that used one as a name parses differently now but SCHEMA can't tell
+COMPILER_VERSION = "0.3"
+# bump when the layout below changes
+FORMAT_VERSION = 2
+MAGIC = b"OBOYUDNO-AST"
+CACHE_DIR = "__oboyudno_cache__"
+
+# every node class gets an op code, its fields are its __slots__ in order
+NODE_CLASSES: list[type] = sorted(
+    (cls for cls in vars(AST).values() if isinstance(cls, type) and issubclass(cls, Node) and "kind" in vars(cls)),
+    key=lambda cls: cls.kind.value,
+)
+NODE_FIELDS: list[tuple[str, ...]] = [cls.__slots__ for cls in NODE_CLASSES]
+NODE_CODES: dict[type, int] = {cls: code for code, cls in enumerate(NODE_CLASSES)}
+# slot descriptors, setting through them skips setattr's lookup
+NODE_SETTERS: list[tuple] = [tuple(vars(cls)[field].__set__ for field in fields) for cls, fields in zip(NODE_CLASSES, NODE_FIELDS)]
+
+OP_PUSH = len(NODE_CLASSES) # next constant
+OP_LIST = OP_PUSH + 1 # list out of the last n values, n is the next constant
+OP_LEAF = OP_LIST + 1 # OP_LEAF + code is a node with only plain values, they are the next constants
+
+# changes on its own whenever an AST class gains, loses or reorders a field
+SCHEMA = blake2b(repr([(cls.__name__, fields) for cls, fields in zip(NODE_CLASSES, NODE_FIELDS)]).encode()).hexdigest()
+
+
+def source_hash(data) -> bytes:
+    return blake2b(data, digest_size=16).digest()
+
+
+def cache_path(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIR, f"{name}.ast")
+
+
+@contextmanager
+def paused_gc():
+    # a whole tree gets built or walked and none of it is garbage, don't let the gc keep rescanning it
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def encode(program: Program) -> bytes:
+    encoder: Encoder = Encoder()
+    with paused_gc():
+        for stm in program.statements:
+            encoder.add(stm)
+    return encoder.finish()
+
+
+def flatten(root: Node) -> tuple[bytes, list]:
+    """
+    Flattens the tree in post order into op codes and constants, children before
+    their parent, without recursing so deep trees are fine. build_statements() undoes it.
+    """
+    ops = bytearray()
+    consts: list = []
+    stack: list[tuple[object, bool]] = [(root, False)]
+    while stack:
+        value, ready = stack.pop()
+        if ready:
+            if isinstance(value, list):
+                ops.append(OP_LIST)
+                consts.append(len(value))
+            else:
+                ops.append(NODE_CODES[type(value)])
+            continue
+
+        if isinstance(value, Node):
+            code = NODE_CODES[type(value)]
+            fields = [getattr(value, field) for field in NODE_FIELDS[code]]
+            if not any(isinstance(field, (Node, list)) for field in fields):
+                # literals and such, the most common nodes, skip the stack
+                ops.append(OP_LEAF + code)
+                consts.extend(fields)
+                continue
+            stack.append((value, True))
+            stack.extend((field, False) for field in reversed(fields))
+        elif isinstance(value, list):
+            stack.append((value, True))
+            stack.extend((item, False) for item in reversed(value))
+        else:
+            ops.append(OP_PUSH)
+            consts.append(value)
+
+    return bytes(ops), consts
+
+
+class Encoder():
+    """
+    Encodes a Program one top level statement at a time, so statements that are
+    compiled and dropped as they come can still be cached without ever having the
+    whole Program. The payload is the ops, the constants and where in the ops
+    every statement ends.
+    """
+    def __init__(self):
+        self.ops = bytearray()
+        self.consts: list = []
+        self.ends: list[int] = []
+
+    def add(self, stm: Node):
+        ops, consts = flatten(stm)
+        self.ops += ops
+        self.consts.extend(consts)
+        self.ends.append(len(self.ops))
+
+    def finish(self) -> bytes:
+        return marshal.dumps((bytes(self.ops), self.consts, self.ends))
+
+
+def decode(payload: bytes) -> Program:
+    ops, consts, ends = marshal.loads(payload)
+    program: Program = Program()
+    with paused_gc():
+        program.statements.extend(build_statements(ops, consts, ends))
+    return program
+
+
+def build_statements(ops: bytes, consts: list, ends: list[int]):
+    # runs the ops statement by statement and yields each top level statement when it's done
+    classes = NODE_CLASSES
+    field_counts = [len(fields) for fields in NODE_FIELDS]
+    setters = NODE_SETTERS
+    push_op = OP_PUSH
+    list_op = OP_LIST
+    leaf_op = OP_LEAF
+    next_const = iter(consts).__next__
+    stack: list = []
+    push = stack.append
+    ops = memoryview(ops)
+    start = 0
+
+    for end in ends:
+        for op in ops[start:end]:
+            if op >= leaf_op:
+                op -= leaf_op
+                node = classes[op].__new__(classes[op])
+                for setter in setters[op]:
+                    setter(node, next_const())
+                push(node)
+            elif op == push_op:
+                push(next_const())
+            elif op == list_op:
+                n = next_const()
+                if n:
+                    items = stack[-n:]
+                    del stack[-n:]
+                    push(items)
+                else:
+                    push([])
+            else:
+                node = classes[op].__new__(classes[op])
+                n = field_counts[op]
+                if n:
+                    for setter, value in zip(setters[op], stack[-n:]):
+                        setter(node, value)
+                    del stack[-n:]
+                push(node)
+
+        if len(stack) != 1 or not isinstance(stack[0], Node):
+            raise ValueError("ast cache payload does not build one statement where it should")
+        yield stack.pop()
+        start = end
+
+
+def read_payload(path: str, key: bytes) -> bytes | None:
+    try:
+        with open(cache_path(path), "rb") as f:
+            header = marshal.loads(f.read())
+        magic, format_version, compiler_version, schema, cached_key, checksum, payload = header
+    except Exception:
+        return None
+    if (magic, format_version, compiler_version, schema, cached_key) != (MAGIC, FORMAT_VERSION, COMPILER_VERSION, SCHEMA, key):
+        return None
+    if not isinstance(payload, bytes) or blake2b(payload, digest_size=16).digest() != checksum:
+        return None
+    return payload
+
+
+def load(path: str, key: bytes) -> Program | None:
+    """
+    Program cached for the source at path, None when there is no entry or it is
+    for another source, another compiler or plain broken.
+    """
+    payload = read_payload(path, key)
+    if payload is None:
+        return None
+    try:
+        return decode(payload)
+    except Exception:
+        # truncated or garbage, just parse the source again
+        return None
+
+
+def load_statements(path: str, key: bytes):
+    """
+    Like load but hands out the top level statements one at a time, only the
+    compact ops and constants stay around, not the whole tree.
+    """
+    payload = read_payload(path, key)
+    if payload is None:
+        return None
+    try:
+        ops, consts, ends = marshal.loads(payload)
+    except Exception:
+        return None
+    return build_statements(ops, consts, ends)
+
+
+def store(path: str, key: bytes, program: Program):
+    write(path, key, encode(program))
+
+
+def write(path: str, key: bytes, payload: bytes):
+    header = (MAGIC, FORMAT_VERSION, COMPILER_VERSION, SCHEMA, key, blake2b(payload, digest_size=16).digest(), payload)
+    target = cache_path(path)
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # write next to it and rename so a crash never leaves half a file behind
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(marshal.dumps(header))
+        os.replace(tmp, target)
+    except OSError:
+        # read only checkout or whatever, the cache is optional
+        pass
@@ -0,0 +1,478 @@
+import math
+import struct
+from typing import Callable
+
+from AST import Node, NodeType, Statement, Expression, Program, count_nodes
+from AST import ExpressionStatement, VarStatement, ReturnStatement, BlockStatement, DefStatement, AssignmentStatement, IfStatement, WhileStatement, ForStatement, MatchStatement
+from AST import InfixExpression, CallExpression, PrefixExpression
+from AST import IntLiteral, FloatLiteral, BoolLiteral, MatchCase
+
+# statements that leave the block, nothing after them in the same block ever runs
+JUMPS = {NodeType.RETURN_STATEMENT, NodeType.BREAK_STATEMENT, NodeType.CONTINUE_STATEMENT}
+# expression statements that are just these compile to nothing, or to a load nobody uses
+PURE = {NodeType.INT_LITERAL, NodeType.FLOAT_LITERAL, NodeType.BOOL_LITERAL, NodeType.STRING_LITERAL, NodeType.INDENTIFIER_LITERAL}
+
+# declared types a literal of that kind compiles to the same thing under, as the unfolded expression would
+LITERAL_TYPES: dict[NodeType, set[str]] = {
+    NodeType.INT_LITERAL: {"int", "int52"},
+    NodeType.FLOAT_LITERAL: {"float", "float69"},
+}
+
+INT_COMPARE: dict[str, Callable] = {
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "==": lambda a, b: a == b,
+}
+
+
+def i32(value: int) -> int:
+    # what the int ends up as in the compiler's i32
+    return (value + (1 << 31)) % (1 << 32) - (1 << 31)
+
+
+def f32(value: float) -> float | None:
+    # rounded to the compiler's 32 bit float, None when it doesn't fit
+    try:
+        return struct.unpack("f", struct.pack("f", value))[0]
+    except OverflowError:
+        return None
+
+
+def power_by_squaring(base, n: int, mul: Callable):
+    """
+    base to the n >= 1 with about 2 * log2(n) calls to mul, right to left over the
+    bits of n. The compiler unrolls constant powers with it and the folder computes
+    them with it, so both multiply in the same order.
+    """
+    result = None
+    while True:
+        if n & 1:
+            result = base if result is None else mul(result, base)
+        n >>= 1
+        if n == 0:
+            return result
+        base = mul(base, base)
+
+
+def int_power(a: int, b: int) -> int:
+    # what oboyudno.ipow gives, a negative power is 1 / a^-b rounded toward zero
+    if b < 0:
+        if a == 1 or a == -1:
+            return a if b & 1 else 1
+        return 0
+    return i32(pow(a, b, 1 << 32))
+
+
+def float_int_power(a: float, b: int) -> float | None:
+    # float ^ int, every multiply rounded to float like the unrolled code does
+    if b == 0:
+        return 1.0
+    value = power_by_squaring(a, abs(b), lambda x, y: f32(x * y) if x is not None and y is not None else None)
+    if value is None or (b < 0 and value == 0):
+        return None
+    return f32(1.0 / value) if b < 0 else value
+
+
+def float_power(a: float, b: float) -> float | None:
+    # llvm.pow.f32, powf rounds its double result the same way
+    try:
+        return f32(math.pow(a, b))
+    except (ValueError, OverflowError):
+        return None
+
+
+def int_op(op: str, a: int, b: int) -> int | bool | None:
+    # a op b on the compiler's i32, None when it's UB or not an int op
+    a, b = i32(a), i32(b)
+    if op in INT_COMPARE:
+        return INT_COMPARE[op](a, b)
+    match op:
+        case "+":
+            return i32(a + b)
+        case "-":
+            return i32(a - b)
+        case "*":
+            return i32(a * b)
+        case "/" | "%":
+            # sdiv/srem by zero and INT_MIN / -1 are UB, leave them to the runtime
+            if b == 0 or (a == -(1 << 31) and b == -1):
+                return None
+            quotient = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1) # sdiv rounds toward zero
+            return quotient if op == "/" else a - b * quotient
+        case "^":
+            return int_power(a, b)
+        case "&":
+            return a & b
+        case "|":
+            return a | b
+        case "~":
+            return a ^ b
+        # the compiler masks the shift amount to 0..31 like x86 does, so it's never poison
+        case "<<":
+            return i32(a << (b & 31))
+        case ">>":
+            return a >> (b & 31)
+    return None
+
+
+def rotate_left(x: int, n: int) -> int:
+    n &= 31
+    x &= 0xFFFFFFFF
+    return i32((x << n) | (x >> (32 - n)))
+
+
+def byte_swap(x: int) -> int:
+    return i32(int.from_bytes((x & 0xFFFFFFFF).to_bytes(4, "little"), "big"))
+
+
+def leading_zeros(x: int) -> int:
+    return 32 - (x & 0xFFFFFFFF).bit_length()
+
+
+def trailing_zeros(x: int) -> int:
+    x &= 0xFFFFFFFF
+    return (x & -x).bit_length() - 1 if x else 32
+
+
+def round_half_away(x: float) -> float:
+    # llvm.round, halfway goes away from zero and not to even like python's round
+    return math.copysign(math.floor(abs(x) + 0.5), x)
+
+
+# builtins the way the compiler's intrinsics compute them, name -> (type, arg count, fn). Only the float
+# ones that come out exact in double and rounded to float are here, sin and co are libm's business
+BUILTINS: dict[str, tuple[str, int, Callable]] = {
+    "popcount": ("int", 1, lambda x: bin(x & 0xFFFFFFFF).count("1")),
+    "clz": ("int", 1, leading_zeros),
+    "ctz": ("int", 1, trailing_zeros),
+    "bswap": ("int", 1, byte_swap),
+    "rotl": ("int", 2, rotate_left),
+    "rotr": ("int", 2, lambda x, n: rotate_left(x, -n)),
+    "min": ("int", 2, min),
+    "max": ("int", 2, max),
+    "abs": ("int", 1, lambda x: i32(abs(x))),
+    "sqrt": ("float", 1, math.sqrt),
+    "fabs": ("float", 1, abs),
+    "floor": ("float", 1, lambda x: float(math.floor(x)) if math.isfinite(x) else x),
+    "ceil": ("float", 1, lambda x: float(math.ceil(x)) if math.isfinite(x) else x),
+    "trunc": ("float", 1, lambda x: float(math.trunc(x)) if math.isfinite(x) else x),
+    "round": ("float", 1, lambda x: round_half_away(x) if math.isfinite(x) else x),
+}
+
+
+def float_op(op: str, a: float, b: float) -> float | bool | None:
+    # a op b on the compiler's 32 bit floats, None when it can't be done exactly like the runtime would
+    a, b = f32(a), f32(b)
+    if a is None or b is None:
+        return None
+    if op in INT_COMPARE:
+        # fcmp_ordered, anything with a NaN is false, same as python
+        return INT_COMPARE[op](a, b)
+    match op:
+        case "+":
+            value = a + b
+        case "-":
+            value = a - b
+        case "*":
+            value = a * b
+        case "/":
+            if b == 0:
+                return None
+            value = a / b
+        case "%":
+            if b == 0:
+                return None
+            value = math.fmod(a, b) # frem is C's fmod
+        case "^":
+            value = float_power(a, b)
+            if value is None:
+                return None
+        case _:
+            return None
+    # one op on two floats done in double and rounded is exactly the float op
+    value = f32(value)
+    if value is None or not math.isfinite(value):
+        return None
+    return value
+
+
+def ends_in_jump(node: Statement) -> bool:
+    # a return/break/continue, or a block that always ends in one like the branch a folded if leaves behind
+    while True:
+        if node.kind == NodeType.EXPRESSION_STATEMENT:
+            node = node.expr
+        elif node.kind == NodeType.BLOCK_STATEMENT and node.statements:
+            node = node.statements[-1]
+        else:
+            return node.kind in JUMPS
+
+
+def literal(value) -> Expression | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return BoolLiteral(value=value)
+    if isinstance(value, int):
+        return IntLiteral(value=value)
+    return FloatLiteral(value=value)
+
+
+def fold_int(op: str, a: int, b: int) -> Expression | None:
+    return literal(int_op(op, a, b))
+
+
+def fold_float(op: str, a: float, b: float) -> Expression | None:
+    return literal(float_op(op, a, b))
+
+
+class ConstantFolder():
+    """
+    AST to AST pass that runs before the compiler: folds arithmetic and
+    comparisons on literals, drops ifs and whiles whose condition is a known bool,
+    code after return/break/continue and expression statements that do nothing.
+    Folds the way the compiler would have computed it (i32 wrap around, 32 bit
+    floats), anything it isn't sure about is left alone.
+
+    Never changes the nodes it's given, changed parts are new nodes and the rest is
+    shared, so cached ASTs stay what the parser made.
+    """
+    def __init__(self):
+        self.folded = 0 # expressions turned into literals
+        self.pruned = 0 # statements and branches dropped
+        self.removed = 0 # nodes fewer than before
+
+        self.fold_fns: dict[NodeType, Callable] = {
+            NodeType.PROGRAM: self.__fold_program,
+            # statements
+            NodeType.EXPRESSION_STATEMENT: self.__fold_expression_statement,
+            NodeType.VAR_STATEMENT: self.__fold_var_statement,
+            NodeType.DEF_STATEMENT: self.__fold_def_statement,
+            NodeType.BLOCK_STATEMENT: self.__fold_block_statement,
+            NodeType.RETURN_STATEMENT: self.__fold_return_statement,
+            NodeType.ASSIGNMENT_STATEMENT: self.__fold_ass_statement,
+            NodeType.IF_STATEMENT: self.__fold_if_statement,
+            NodeType.WHILE_STATEMENT: self.__fold_while_statement,
+            NodeType.FOR_STATEMENT: self.__fold_for_statement,
+            NodeType.MATCH_STATEMENT: self.__fold_match_statement,
+            # expressions
+            NodeType.INFIX_EXPRESSION: self.__fold_infix_expression,
+            NodeType.PREFIX_EXPRESSION: self.__fold_prefix_expression,
+            NodeType.CALL_EXPRESSION: self.__fold_call_expression,
+        }
+
+    def fold(self, node: Node) -> Node | None:
+        """ The folded node, None if the whole statement is dead """
+        before: int = count_nodes(node)
+        folded: Node | None = self.__fold(node)
+        self.removed += before - (count_nodes(folded) if folded is not None else 0)
+        return folded
+
+    def report(self) -> str:
+        return f"constant folding: {self.folded} expressions folded, {self.pruned} statements pruned, {self.removed} nodes removed"
+
+    def __fold(self, node: Node | None) -> Node | None:
+        if node is None:
+            return None
+        fold_fn: Callable | None = self.fold_fns.get(node.kind)
+        if fold_fn is None:
+            # literals, identifiers, break and friends, nothing to do
+            return node
+        return fold_fn(node)
+
+    def __fold_statements(self, statements: list[Statement]) -> list[Statement]:
+        out: list[Statement] = []
+        for i, stm in enumerate(statements):
+            folded: Statement | None = self.__fold(stm)
+            if folded is None:
+                self.pruned += 1
+                continue
+            out.append(folded)
+            if ends_in_jump(folded):
+                self.pruned += len(statements) - i - 1
+                break
+        return out
+
+    # statements
+    def __fold_program(self, node: Program):
+        program: Program = Program()
+        program.statements = self.__fold_statements(node.statements)
+        return program
+
+    def __fold_expression_statement(self, node: ExpressionStatement):
+        expr: Expression = self.__fold(node.expr)
+        # ifs come wrapped in expression statements, a dropped if leaves nothing to wrap
+        if expr is None or expr.kind in PURE:
+            return None
+        return node if expr is node.expr else ExpressionStatement(expr=expr)
+
+    def __fold_var_statement(self, node: VarStatement):
+        folded: int = self.folded
+        value: Expression = self.__fold(node.value)
+        if value is not node.value and node.value_type is not None and node.value_type not in LITERAL_TYPES.get(value.kind, (node.value_type,)):
+            # the compiler makes a literal into the declared type but an expression keeps its own,
+            # var x: float = 2 + 3 has to stay an int expression
+            self.folded = folded
+            return node
+        return node if value is node.value else VarStatement(name=node.name, value=value, value_type=node.value_type)
+
+    def __fold_def_statement(self, node: DefStatement):
+        block: BlockStatement = self.__fold(node.block)
+        if block is node.block:
+            return node
+        return DefStatement(name=node.name, params=node.params, ret_type=node.ret_type, block=block, exported=node.exported,
+                            fastmath=node.fastmath)
+
+    def __fold_block_statement(self, node: BlockStatement):
+        statements: list[Statement] = self.__fold_statements(node.statements)
+        if len(statements) == len(node.statements) and all(a is b for a, b in zip(statements, node.statements)):
+            return node
+        return BlockStatement(statements=statements)
+
+    def __fold_return_statement(self, node: ReturnStatement):
+        ret_value: Expression = self.__fold(node.ret_value)
+        return node if ret_value is node.ret_value else ReturnStatement(ret_value=ret_value)
+
+    def __fold_ass_statement(self, node: AssignmentStatement):
+        new_value: Expression = self.__fold(node.new_value)
+        if new_value is node.new_value:
+            return node
+        stm: AssignmentStatement = AssignmentStatement(iden=node.iden, new_value=new_value)
+        stm.op = node.op
+        return stm
+
+    def __fold_if_statement(self, node: IfStatement):
+        condition: Expression = self.__fold(node.condition)
+        if condition.kind == NodeType.BOOL_LITERAL:
+            # only the branch that runs is left, as a plain block so it keeps its own scope
+            taken: BlockStatement | None = node.true_block if condition.value else node.else_block
+            if taken is None:
+                return None
+            self.pruned += 1
+            return self.__fold(taken)
+        true_block: BlockStatement = self.__fold(node.true_block)
+        else_block: BlockStatement | None = self.__fold(node.else_block)
+        if condition is node.condition and true_block is node.true_block and else_block is node.else_block:
+            return node
+        return IfStatement(condition=condition, true_block=true_block, else_block=else_block)
+
+    def __fold_while_statement(self, node: WhileStatement):
+        condition: Expression = self.__fold(node.condition)
+        if condition.kind == NodeType.BOOL_LITERAL and not condition.value:
+            return None
+        block: BlockStatement = self.__fold(node.block)
+        if condition is node.condition and block is node.block:
+            return node
+        return WhileStatement(condition=condition, block=block, hints=node.hints)
+
+    def __fold_for_statement(self, node: ForStatement):
+        var_decl: VarStatement = self.__fold(node.var_decl)
+        condition: Expression = self.__fold(node.condition)
+        if condition.kind == NodeType.BOOL_LITERAL and not condition.value:
+            # the body never runs, only the declaration is left, in its own scope like before
+            self.pruned += 1
+            return BlockStatement(statements=[var_decl])
+        op: AssignmentStatement = self.__fold(node.op)
+        block: BlockStatement = self.__fold(node.block)
+        if var_decl is node.var_decl and condition is node.condition and op is node.op and block is node.block:
+            return node
+        return ForStatement(var_declaration=var_decl, condition=condition, op=op, block=block, hints=node.hints)
+
+    def __fold_match_statement(self, node: MatchStatement):
+        subject: Expression = self.__fold(node.subject)
+        cases: list[MatchCase] = []
+        for case in node.cases:
+            values: list[Expression] = [self.__fold(value) for value in case.values]
+            block: BlockStatement = self.__fold(case.block)
+            if block is case.block and all(a is b for a, b in zip(values, case.values)):
+                cases.append(case)
+            else:
+                cases.append(MatchCase(values=values, block=block))
+
+        if subject.kind == NodeType.INT_LITERAL and all(value.kind == NodeType.INT_LITERAL for case in cases for value in case.values):
+            # only the case that gets picked is left, as a plain block like a folded if, so a case
+            # ending in return/break/continue prunes what comes after the match the same way
+            picked: int = i32(subject.int)
+            taken: BlockStatement | None = next(
+                (case.block for case in cases if any(i32(value.int) == picked for value in case.values)), node.default
+            )
+            if taken is None:
+                return None
+            self.pruned += 1
+            return self.__fold(taken) if taken is node.default else taken
+
+        default: BlockStatement | None = self.__fold(node.default)
+        if subject is node.subject and default is node.default and all(a is b for a, b in zip(cases, node.cases)):
+            return node
+        return MatchStatement(subject=subject, cases=cases, default=default)
+
+    # expressions
+    def __fold_logical(self, node: InfixExpression):
+        l_node: Expression = self.__fold(node.l_node)
+        if l_node.kind == NodeType.BOOL_LITERAL:
+            if l_node.value == (node.op == "||"):
+                # the left side decides, the right side never runs
+                self.folded += 1
+                return l_node
+            r_node: Expression = self.__fold(node.r_node)
+            if r_node.kind == NodeType.BOOL_LITERAL:
+                self.folded += 1
+                return r_node
+        else:
+            r_node: Expression = self.__fold(node.r_node)
+        # x && false still has to run x, and true && x is only x if x is a bool, so the rest stays
+        if l_node is node.l_node and r_node is node.r_node:
+            return node
+        return InfixExpression(l_node=l_node, op=node.op, r_node=r_node)
+
+    def __fold_infix_expression(self, node: InfixExpression):
+        if node.op == "&&" or node.op == "||":
+            return self.__fold_logical(node)
+        l_node: Expression = self.__fold(node.l_node)
+        r_node: Expression = self.__fold(node.r_node)
+
+        folded: Expression | None = None
+        if l_node.kind == NodeType.INT_LITERAL and r_node.kind == NodeType.INT_LITERAL:
+            folded = fold_int(node.op, l_node.int, r_node.int)
+        elif l_node.kind == NodeType.FLOAT_LITERAL and r_node.kind == NodeType.FLOAT_LITERAL:
+            folded = fold_float(node.op, l_node.float, r_node.float)
+        elif node.op == "^" and l_node.kind == NodeType.FLOAT_LITERAL and r_node.kind == NodeType.INT_LITERAL:
+            base: float | None = f32(l_node.float)
+            value: float | None = float_int_power(base, i32(r_node.int)) if base is not None else None
+            if value is not None and math.isfinite(value):
+                folded = FloatLiteral(value=value)
+        elif node.op == "^" and l_node.kind == NodeType.INT_LITERAL and r_node.kind == NodeType.FLOAT_LITERAL:
+            folded = fold_float("^", float(i32(l_node.int)), r_node.float)
+        if folded is not None:
+            self.folded += 1
+            return folded
+
+        if l_node is node.l_node and r_node is node.r_node:
+            return node
+        return InfixExpression(l_node=l_node, op=node.op, r_node=r_node)
+
+    def __fold_prefix_expression(self, node: PrefixExpression):
+        r_node: Expression = self.__fold(node.r_node)
+
+        folded: Expression | None = None
+        match node.op, r_node.kind:
+            case "-", NodeType.INT_LITERAL:
+                folded = IntLiteral(value=i32(-i32(r_node.int)))
+            case "-", NodeType.FLOAT_LITERAL:
+                folded = FloatLiteral(value=-r_node.float)
+            case "!", NodeType.INT_LITERAL:
+                folded = IntLiteral(value=~i32(r_node.int)) # not_ on an i32 flips every bit
+            case "!", NodeType.BOOL_LITERAL:
+                folded = BoolLiteral(value=not r_node.value)
+        if folded is not None:
+            self.folded += 1
+            return folded
+
+        return node if r_node is node.r_node else PrefixExpression(op=node.op, r_node=r_node)
+
+    def __fold_call_expression(self, node: CallExpression):
+        args: list[Expression] = [self.__fold(arg) for arg in node.args]
+        if all(a is b for a, b in zip(args, node.args)):
+            return node
+        return CallExpression(def_=node.def_, args=args)
@@ -0,0 +1,137 @@
+from json.encoder import encode_basestring_ascii
+from types import GeneratorType
+from typing import IO, Iterator
+
+from AST import Node, Program
+
+FLUSH_PIECES = 4096
+MISSING = object()
+
+
+def scalar(value) -> str:
+    # same text json.dumps gives for plain values
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "Infinity" if value > 0 else "-Infinity"
+        return float.__repr__(value)
+    return int.__repr__(value)
+
+
+def iter_json(value, indent: int | None = 4, level: int = 0) -> Iterator[str]:
+    """
+    Yields the text of json.dumps(value.json(), indent=indent) piece by piece,
+    walking the nodes through json_fields() with its own stack instead of building
+    the dicts first. With indent None it's the compact form, no spaces at all.
+    level is how deep value sits in whatever is around it.
+    """
+    key_sep = ": " if indent is not None else ":"
+    stack: list[tuple[Iterator, bool]] = []
+
+    while True:
+        if value is not MISSING:
+            if isinstance(value, Node):
+                items, is_obj = iter(value.json_fields()), True
+            elif isinstance(value, dict):
+                items, is_obj = iter(value.items()), True
+            elif isinstance(value, (list, tuple, GeneratorType)):
+                items, is_obj = iter(value), False
+            else:
+                yield scalar(value)
+                items = None
+
+            if items is not None:
+                first = next(items, MISSING)
+                if first is MISSING:
+                    yield "{}" if is_obj else "[]"
+                else:
+                    level += 1
+                    yield ("{" if is_obj else "[") + newline(indent, level)
+                    stack.append((items, is_obj))
+                    if is_obj:
+                        key, value = first
+                        yield encode_basestring_ascii(key) + key_sep
+                    else:
+                        value = first
+                    continue
+            value = MISSING
+
+        # the last value is done, move on to the next item of whatever contains it
+        if not stack:
+            return
+        items, is_obj = stack[-1]
+        item = next(items, MISSING)
+        if item is MISSING:
+            stack.pop()
+            level -= 1
+            yield newline(indent, level) + ("}" if is_obj else "]")
+            continue
+        yield "," + newline(indent, level)
+        if is_obj:
+            key, value = item
+            yield encode_basestring_ascii(key) + key_sep
+        else:
+            value = item
+
+
+def newline(indent: int | None, level: int) -> str:
+    return "" if indent is None else "\n" + " " * (indent * level)
+
+
+def write_pieces(pieces: Iterator[str], f: IO[str]):
+    buffer: list[str] = []
+    for piece in pieces:
+        buffer.append(piece)
+        if len(buffer) >= FLUSH_PIECES:
+            f.write("".join(buffer))
+            buffer.clear()
+    f.write("".join(buffer))
+
+
+def dump(program: Program, f: IO[str], indent: int | None = 4):
+    # byte for byte what json.dump(program.json(), f, indent=indent) writes, without the dicts
+    write_pieces(iter_json(program, indent), f)
+
+
+def dump_lines(program: Program, f: IO[str]):
+    # compact, one top level statement per line, each wrapped like in Program.json()
+    for stm in program.statements:
+        write_pieces(iter_json({stm.kind.value: stm}, None), f)
+        f.write("\n")
+
+
+class ProgramDump():
+    """
+    Writes what dump() writes for a Program that only exists one top level
+    statement at a time, add() each statement as it comes and close() at the end.
+    lines, if given, gets what dump_lines() writes.
+    """
+    def __init__(self, f: IO[str], indent: int | None = 4, lines: IO[str] | None = None):
+        self.f = f
+        self.indent = indent
+        self.lines = lines
+        self.count = 0
+        key_sep = ": " if indent is not None else ":"
+        f.write("{" + newline(indent, 1) + encode_basestring_ascii("type") + key_sep + scalar(Program.kind.value) + ","
+                + newline(indent, 1) + encode_basestring_ascii("statements") + key_sep)
+
+    def add(self, stm: Node):
+        wrapped = {stm.kind.value: stm}
+        self.f.write(("[" if self.count == 0 else ",") + newline(self.indent, 2))
+        write_pieces(iter_json(wrapped, self.indent, 2), self.f)
+        self.count += 1
+        if self.lines is not None:
+            write_pieces(iter_json(wrapped, None), self.lines)
+            self.lines.write("\n")
+
+    def close(self):
+        self.f.write(("[]" if self.count == 0 else newline(self.indent, 1) + "]") + newline(self.indent, 0) + "}")
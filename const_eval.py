@@ -0,0 +1,375 @@
+import math
+from typing import Callable
+
+from AST import Node, NodeType, Statement, Expression, walk
+from AST import ExpressionStatement, VarStatement, ReturnStatement, BlockStatement, DefStatement, AssignmentStatement, IfStatement, WhileStatement, ForStatement, MatchStatement
+from AST import InfixExpression, CallExpression, PrefixExpression
+from AST import IntLiteral, FloatLiteral, IdentifierLiteral, BoolLiteral
+from ast_folder import i32, f32, int_op, float_op, float_int_power, BUILTINS
+
+DEFAULT_STEP_BUDGET = 10_000
+# every call level is about ten python frames deep (more with nested ifs and loops), so python's
+# default limit of 1000 runs out around 100 calls deep. Stay well under that so this is the limit that applies
+MAX_DEPTH = 64
+
+# what a value of each declared type looks like in here
+INT_TYPES = {"int", "int52"}
+FLOAT_TYPES = {"float", "float69"}
+
+# nodes a pure def may contain, anything else (strings, imports, nested defs) and it's not pure
+PURE_NODES = {
+    NodeType.EXPRESSION_STATEMENT, NodeType.VAR_STATEMENT, NodeType.BLOCK_STATEMENT, NodeType.RETURN_STATEMENT,
+    NodeType.ASSIGNMENT_STATEMENT, NodeType.IF_STATEMENT, NodeType.WHILE_STATEMENT, NodeType.FOR_STATEMENT,
+    NodeType.BREAK_STATEMENT, NodeType.CONTINUE_STATEMENT, NodeType.INFIX_EXPRESSION, NodeType.PREFIX_EXPRESSION,
+    NodeType.CALL_EXPRESSION, NodeType.INT_LITERAL, NodeType.FLOAT_LITERAL, NodeType.INDENTIFIER_LITERAL,
+    NodeType.BOOL_LITERAL, NodeType.LOOP_HINT, NodeType.MATCH_STATEMENT, NodeType.MATCH_CASE,
+}
+
+
+class NotConstant(Exception):
+    """ The call can't be done at compile time, or not exactly like the runtime would do it """
+
+
+class Returned():
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+BREAK = object()
+CONTINUE = object()
+FAILED = object()
+
+
+def type_of(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    return "float"
+
+
+def fits(value, type_name: str) -> bool:
+    kind: str = type_of(value)
+    return type_name == kind or (kind == "int" and type_name in INT_TYPES) or (kind == "float" and type_name in FLOAT_TYPES)
+
+
+class ConstEvaluator():
+    """
+    Runs calls to pure defs with constant arguments at compile time, on the AST,
+    with the compiler's semantics (i32 wrap around, 32 bit floats). A def is pure
+    when it only does math on its params and locals and only calls pure defs, so
+    no print and no strings. Every statement and expression costs a step, a call
+    that runs out of steps (or does anything the runtime might do differently) is
+    just left for the runtime.
+
+    Keeps every top level def it's told about, compiled, dropped or still waiting,
+    so whether a call becomes a constant doesn't depend on what got compiled first.
+    """
+    def __init__(self, step_budget: int = DEFAULT_STEP_BUDGET):
+        self.step_budget = step_budget
+        self.defs: dict[str, DefStatement] = {}
+        self.pure: dict[str, bool] = {}
+        self.results: dict[tuple, object] = {} # (name, args) -> value, or FAILED for a call from the compiler that gave up
+        self.evaluated = 0 # calls turned into constants
+        self.steps = 0 # steps spent on all of them, the ones that gave up included
+        self.steps_left = 0
+
+        self.exec_fns: dict[NodeType, Callable] = {
+            NodeType.EXPRESSION_STATEMENT: self.__exec_expression_statement,
+            NodeType.VAR_STATEMENT: self.__exec_var_statement,
+            NodeType.BLOCK_STATEMENT: self.__exec_block_statement,
+            NodeType.RETURN_STATEMENT: self.__exec_return_statement,
+            NodeType.ASSIGNMENT_STATEMENT: self.__exec_ass_statement,
+            NodeType.IF_STATEMENT: self.__exec_if_statement,
+            NodeType.WHILE_STATEMENT: self.__exec_while_statement,
+            NodeType.FOR_STATEMENT: self.__exec_for_statement,
+            NodeType.MATCH_STATEMENT: self.__exec_match_statement,
+            NodeType.BREAK_STATEMENT: lambda node, scopes, depth: BREAK,
+            NodeType.CONTINUE_STATEMENT: lambda node, scopes, depth: CONTINUE,
+        }
+        self.eval_fns: dict[NodeType, Callable] = {
+            NodeType.INT_LITERAL: lambda node, scopes, depth: i32(node.int),
+            NodeType.FLOAT_LITERAL: self.__eval_float_literal,
+            NodeType.BOOL_LITERAL: lambda node, scopes, depth: bool(node.value),
+            NodeType.INDENTIFIER_LITERAL: self.__eval_identifier,
+            NodeType.INFIX_EXPRESSION: self.__eval_infix_expression,
+            NodeType.PREFIX_EXPRESSION: self.__eval_prefix_expression,
+            NodeType.CALL_EXPRESSION: self.__eval_call_expression,
+        }
+
+    def define(self, node: DefStatement):
+        # a new def with the same name changes what calls to it mean, forget what we knew
+        self.defs[node.name.value] = node
+        self.pure.clear()
+        self.results.clear()
+
+    def is_pure(self, name: str) -> bool:
+        if name in BUILTINS and name not in self.defs:
+            return True
+        if name not in self.pure:
+            # recursion is fine, a def is pure until something in it says otherwise
+            self.pure[name] = True
+            node: DefStatement | None = self.defs.get(name)
+            self.pure[name] = node is not None and all(
+                child.kind in PURE_NODES and (child.kind != NodeType.CALL_EXPRESSION or self.is_pure(child.def_.value))
+                for child in walk(node.block)
+            )
+        return self.pure[name]
+
+    def return_type(self, name: str) -> str:
+        def_: DefStatement | None = self.defs.get(name)
+        return def_.ret_type if def_ is not None else BUILTINS[name][0]
+
+    def evaluate(self, node: CallExpression):
+        """ The value of the call, raises NotConstant when it has to wait for the runtime """
+        if not self.is_pure(node.def_.value):
+            raise NotConstant(node.def_.value)
+        self.steps_left = self.step_budget
+        try:
+            value = self.__eval(node, [], 0)
+        except RecursionError:
+            raise NotConstant(node.def_.value)
+        finally:
+            self.steps += self.step_budget - self.steps_left
+        self.evaluated += 1
+        return value
+
+    def report(self) -> str:
+        return f"compile time calls: {self.evaluated} calls evaluated in {self.steps} steps"
+
+    # region helpers
+    def __step(self):
+        self.steps_left -= 1
+        if self.steps_left < 0:
+            raise NotConstant("out of steps")
+
+    def __exec(self, node: Statement, scopes: list[dict], depth: int):
+        self.__step()
+        exec_fn: Callable | None = self.exec_fns.get(node.kind)
+        if exec_fn is None:
+            raise NotConstant(node.kind)
+        return exec_fn(node, scopes, depth)
+
+    def __eval(self, node: Expression, scopes: list[dict], depth: int):
+        self.__step()
+        eval_fn: Callable | None = self.eval_fns.get(node.kind)
+        if eval_fn is None:
+            raise NotConstant(node.kind)
+        return eval_fn(node, scopes, depth)
+
+    def __lookup(self, name: str, scopes: list[dict]) -> dict:
+        for scope in reversed(scopes):
+            if name in scope:
+                return scope
+        raise NotConstant(name)
+
+    def __exec_block(self, statements: list[Statement], scopes: list[dict], depth: int):
+        scopes.append({})
+        try:
+            for stm in statements:
+                signal = self.__exec(stm, scopes, depth)
+                if signal is not None:
+                    return signal
+            return None
+        finally:
+            scopes.pop()
+
+    def __loop(self, condition: Expression, block: BlockStatement, step: Statement | None, scopes: list[dict], depth: int):
+        while self.__condition(condition, scopes, depth):
+            signal = self.__exec(block, scopes, depth)
+            if signal is BREAK:
+                break
+            if signal is not None and signal is not CONTINUE:
+                return signal
+            if step is not None:
+                self.__exec(step, scopes, depth)
+        return None
+
+    def __condition(self, condition: Expression, scopes: list[dict], depth: int) -> bool:
+        value = self.__eval(condition, scopes, depth)
+        if not isinstance(value, bool):
+            raise NotConstant("condition is not a bool")
+        return value
+    # endregion
+
+    # statements
+    def __exec_expression_statement(self, node: ExpressionStatement, scopes: list[dict], depth: int):
+        if node.expr is not None and node.expr.kind == NodeType.IF_STATEMENT:
+            return self.__exec(node.expr, scopes, depth)
+        self.__eval(node.expr, scopes, depth)
+        return None
+
+    def __exec_var_statement(self, node: VarStatement, scopes: list[dict], depth: int):
+        name: str = node.name.value
+        if node.value.kind == NodeType.INT_LITERAL and node.value_type in FLOAT_TYPES:
+            # the compiler makes the literal a float constant right away
+            value = f32(float(node.value.int))
+        else:
+            value = self.__eval(node.value, scopes, depth)
+        for scope in reversed(scopes):
+            if name in scope:
+                # declaring it again just stores into the one that's there
+                if type_of(scope[name]) != type_of(value):
+                    raise NotConstant(name)
+                scope[name] = value
+                return None
+        if not fits(value, node.value_type):
+            raise NotConstant(name)
+        scopes[-1][name] = value
+        return None
+
+    def __exec_block_statement(self, node: BlockStatement, scopes: list[dict], depth: int):
+        return self.__exec_block(node.statements, scopes, depth)
+
+    def __exec_return_statement(self, node: ReturnStatement, scopes: list[dict], depth: int):
+        return Returned(self.__eval(node.ret_value, scopes, depth))
+
+    def __exec_ass_statement(self, node: AssignmentStatement, scopes: list[dict], depth: int):
+        name: str = node.iden.value
+        scope: dict = self.__lookup(name, scopes)
+        old = scope[name]
+        new = self.__eval(node.new_value, scopes, depth)
+        if type_of(old) != type_of(new):
+            raise NotConstant(name)
+        if node.op != "=":
+            op: str = node.op[0]
+            if isinstance(old, bool) or op not in "+-*/":
+                raise NotConstant(node.op)
+            new = int_op(op, old, new) if isinstance(old, int) else float_op(op, old, new)
+            if new is None:
+                raise NotConstant(node.op)
+        scope[name] = new
+        return None
+
+    def __exec_if_statement(self, node: IfStatement, scopes: list[dict], depth: int):
+        if self.__condition(node.condition, scopes, depth):
+            return self.__exec(node.true_block, scopes, depth)
+        if node.else_block is not None:
+            return self.__exec(node.else_block, scopes, depth)
+        return None
+
+    def __exec_while_statement(self, node: WhileStatement, scopes: list[dict], depth: int):
+        return self.__loop(node.condition, node.block, None, scopes, depth)
+
+    def __exec_for_statement(self, node: ForStatement, scopes: list[dict], depth: int):
+        scopes.append({})
+        try:
+            self.__exec(node.var_decl, scopes, depth)
+            return self.__loop(node.condition, node.block, node.op, scopes, depth)
+        finally:
+            scopes.pop()
+
+    def __exec_match_statement(self, node: MatchStatement, scopes: list[dict], depth: int):
+        subject = self.__eval(node.subject, scopes, depth)
+        if type_of(subject) != "int":
+            raise NotConstant("match on something that isn't an int")
+        for case in node.cases:
+            for value in case.values:
+                value = self.__eval(value, scopes, depth)
+                if type_of(value) != "int":
+                    raise NotConstant("case value is not an int")
+                if value == subject:
+                    return self.__exec(case.block, scopes, depth)
+        if node.default is not None:
+            return self.__exec(node.default, scopes, depth)
+        return None
+
+    # expressions
+    def __eval_float_literal(self, node: FloatLiteral, scopes: list[dict], depth: int):
+        value: float | None = f32(node.float)
+        if value is None:
+            raise NotConstant(node.float)
+        return value
+
+    def __eval_identifier(self, node: IdentifierLiteral, scopes: list[dict], depth: int):
+        return self.__lookup(node.value, scopes)[node.value]
+
+    def __eval_infix_expression(self, node: InfixExpression, scopes: list[dict], depth: int):
+        if node.op == "&&" or node.op == "||":
+            # short circuits like the compiled code, the right side may not even be constant
+            if self.__condition(node.l_node, scopes, depth) == (node.op == "||"):
+                return node.op == "||"
+            return self.__condition(node.r_node, scopes, depth)
+        left = self.__eval(node.l_node, scopes, depth)
+        right = self.__eval(node.r_node, scopes, depth)
+        left_type, right_type = type_of(left), type_of(right)
+
+        value = None
+        if left_type == right_type == "int":
+            value = int_op(node.op, left, right)
+        elif left_type == right_type == "float":
+            value = float_op(node.op, left, right)
+        elif node.op == "^" and left_type == "float" and right_type == "int":
+            value = float_int_power(left, right)
+            if value is not None and not math.isfinite(value):
+                value = None
+        elif node.op == "^" and left_type == "int" and right_type == "float":
+            value = float_op("^", float(left), right)
+        if value is None:
+            raise NotConstant(node.op)
+        return value
+
+    def __eval_prefix_expression(self, node: PrefixExpression, scopes: list[dict], depth: int):
+        value = self.__eval(node.r_node, scopes, depth)
+        match node.op, type_of(value):
+            case "-", "int":
+                return i32(-value)
+            case "-", "float":
+                return -value
+            case "!", "int":
+                return ~value
+            case "!", "bool":
+                return not value
+        raise NotConstant(node.op)
+
+    def __eval_builtin(self, node: CallExpression, scopes: list[dict], depth: int):
+        type_name, arg_count, fn = BUILTINS[node.def_.value]
+        args: list = [self.__eval(arg, scopes, depth) for arg in node.args]
+        if len(args) != arg_count or any(type_of(arg) not in ("int", type_name) for arg in args):
+            raise NotConstant(node.def_.value)
+        if type_name == "int":
+            return fn(*args)
+        # ints going into a float builtin get sitofp'd first, like the compiler does
+        args = [f32(float(arg)) for arg in args]
+        try:
+            value: float | None = f32(fn(*args))
+        except (ValueError, OverflowError):
+            raise NotConstant(node.def_.value)
+        if value is None or not math.isfinite(value):
+            raise NotConstant(node.def_.value)
+        return value
+
+    def __eval_call_expression(self, node: CallExpression, scopes: list[dict], depth: int):
+        name: str = node.def_.value
+        def_: DefStatement | None = self.defs.get(name)
+        if def_ is None and name in BUILTINS:
+            return self.__eval_builtin(node, scopes, depth)
+        if def_ is None or depth >= MAX_DEPTH or len(node.args) != len(def_.params):
+            raise NotConstant(name)
+        args: list = [self.__eval(arg, scopes, depth) for arg in node.args]
+        for arg, param in zip(args, def_.params):
+            if not fits(arg, param.val_type):
+                raise NotConstant(name)
+
+        key: tuple = (name, *((type_of(arg), arg) for arg in args))
+        value = self.results.get(key)
+        if value is FAILED:
+            raise NotConstant(name)
+        if value is None:
+            frame: list[dict] = [{param.name: arg for param, arg in zip(def_.params, args)}]
+            try:
+                signal = self.__exec(def_.block, frame, depth + 1)
+                if not isinstance(signal, Returned):
+                    raise NotConstant(f"{name} doesn't return")
+            except NotConstant:
+                if depth == 0:
+                    # deeper down it may only have run out of what was left of the budget
+                    self.results[key] = FAILED
+                raise
+            value = signal.value
+            self.results[key] = value
+        if not fits(value, def_.ret_type):
+            raise NotConstant(name)
+        return value
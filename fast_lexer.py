@@ -0,0 +1,164 @@
+import re
+from typing import Callable
+from Token import Token, TokenType, KEYWORDS, OBOYUDNO_KEYWORDS, TYPE_KEYWORDS
+
+
+# same priority as lookup_ident: KEYWORDS beat OBOYUDNO_KEYWORDS beat TYPE_KEYWORDS
+IDENT_TYPES: dict[str, TokenType] = {
+    **{type_name: TokenType.TYPE for type_name in TYPE_KEYWORDS},
+    **OBOYUDNO_KEYWORDS,
+    **KEYWORDS,
+}
+
+CHAR_TYPES: dict[str, TokenType] = {
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '^': TokenType.POW,
+    '%': TokenType.PERCENT,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    ',': TokenType.COMMA,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    '<': TokenType.LESS,
+    '>': TokenType.GREATER,
+    '=': TokenType.EQ,
+    '!': TokenType.NOT,
+    ';': TokenType.SEPARATOR,
+    ':': TokenType.COLON,
+    '🤙': TokenType.COLON,
+    '@': TokenType.AT,
+    '&': TokenType.BIT_AND,
+    '|': TokenType.BIT_OR,
+    '~': TokenType.XOR,
+}
+
+DOUBLE_TYPES: dict[str, TokenType] = {
+    '+=': TokenType.PLUS_EQ,
+    '->': TokenType.ARROW,
+    '-=': TokenType.MINUS_EQ,
+    '*=': TokenType.MUL_EQ,
+    '/=': TokenType.DIV_EQ,
+    '<=': TokenType.LESS_EQ,
+    '>=': TokenType.GREATER_EQ,
+    '==': TokenType.DOUBLE_EQ,
+    '!=': TokenType.NOT_EQ,
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '<<': TokenType.SHL,
+    '>>': TokenType.SHR,
+}
+
+# every token that is always spelled the same way -> (type, how far before the end Lexer puts `place`)
+FIXED_TOKENS: dict[str, tuple[TokenType, int]] = {
+    **{literal: (type_, 0) for literal, type_ in IDENT_TYPES.items()},
+    **{literal: (type_, 1) for literal, type_ in CHAR_TYPES.items()},
+    **{literal: (type_, 1) for literal, type_ in DOUBLE_TYPES.items()},
+}
+
+IDENT_START = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_")
+DIGITS = frozenset("0123456789")
+WHITESPACE = frozenset(" \t\r\n")
+
+# one alternative per token shape, possessive so sre never backtracks into a token
+TOKEN_RE = re.compile(r"""
+      [ \t\r\n]++                   # whitespace, only here do we count lines (like Lexer)
+    | B--.?                         # B--D, Lexer eats 4 chars no matter what the last one is
+    | [A-Za-z_]\w*+                 # identifiers and keywords, \w == isalnum() or '_'
+    | [-+*/<>=!]=|->|&&|\|\||<<|>>  # two char operators
+    | [0-9]++(?:\.[0-9]*+)?+        # numbers, a second dot is handled by the scanner
+    | "[^"]*+"?+                    # strings, may be unterminated
+    | .                             # everything else
+""", re.VERBOSE | re.DOTALL)
+
+# chunks always end right after a newline so only a string can get cut in half
+CHUNK_SIZE = 1 << 16
+
+
+def chunks(source: str, pos: int = 0, chunk_size: int | None = None):
+    """
+    Yields (offset, token literals) for the source a chunk at a time, whitespace
+    runs included, so callers can keep offsets by just adding up lengths. Starts at
+    pos, which has to be a token or whitespace start.
+    """
+    length = len(source)
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    while pos < length:
+        stop = source.find('\n', pos + chunk_size)
+        stop = length if stop == -1 else stop + 1
+        tokens = TOKEN_RE.findall(source, pos, stop)
+        while stop < length and tokens[-1][0] == '"' and (len(tokens[-1]) == 1 or tokens[-1][-1] != '"'):
+            # string runs over the chunk end, stretch the chunk past its closing quote
+            close = source.find('"', stop)
+            stop = source.find('\n', close) if close != -1 else -1
+            stop = length if stop == -1 else stop + 1
+            tokens = TOKEN_RE.findall(source, pos, stop)
+        yield pos, tokens
+        pos = stop
+
+
+class FastLexer():
+    """
+    Drop-in replacement for Lexer that runs one compiled regex over the source a
+    chunk at a time and classifies tokens with table lookups instead of stepping
+    char by char. Produces the exact same Token stream, row/place quirks included.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        # hand out the generator's own __next__, saves a python frame per token
+        self.next_token: Callable[[], Token] = self.__scan().__next__
+
+    def __scan(self):
+        source = self.source
+        fixed = FIXED_TOKENS
+        ident_start = IDENT_START
+        digits = DIGITS
+        whitespace = WHITESPACE
+        line_no = 1
+        eof_place = len(source)
+
+        for pos, tokens in chunks(source):
+            for literal in tokens:
+                start = pos
+                pos += len(literal)
+
+                hit = fixed.get(literal)
+                if hit is not None:
+                    yield Token(hit[0], literal, line_no, pos - hit[1])
+                    continue
+
+                ch = literal[0]
+                if ch in whitespace:
+                    line_no += literal.count('\n')
+                elif ch in ident_start:
+                    if literal.startswith('B--'):
+                        # Lexer always steps 4 chars here, even past the end of the source
+                        if start + 4 > eof_place:
+                            eof_place = start + 4
+                        yield Token(TokenType.IDENTIFIER, literal, line_no, start + 4)
+                    else:
+                        yield Token(TokenType.IDENTIFIER, literal, line_no, pos)
+                elif ch in digits:
+                    if source.startswith('.', pos):
+                        print(f"That shit is NOT a number at line {line_no} place {pos}")
+                        yield Token(TokenType.UNKNOWN, literal, line_no, pos)
+                    elif '.' in literal:
+                        yield Token(TokenType.FLOAT, float(literal), line_no, pos)
+                    else:
+                        yield Token(TokenType.INT, int(literal), line_no, pos)
+                elif ch == '"':
+                    if len(literal) > 1 and literal[-1] == '"':
+                        yield Token(TokenType.STRING, literal[1:-1], line_no, pos - 1)
+                    else:
+                        # unterminated, Lexer ran off the end and stepped once more
+                        yield Token(TokenType.STRING, literal[1:], line_no, pos)
+                        eof_place = pos + 1
+                else:
+                    yield Token(TokenType.UNKNOWN, literal, line_no, start)
+
+        while True:
+            yield Token(TokenType.EOF, "", line_no, eof_place)
+            eof_place += 1
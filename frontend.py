@@ -0,0 +1,89 @@
+from typing import Callable, Iterator
+from lexer import Lexer
+from fast_lexer import FastLexer
+from token_stream import TokenStream
+from source_file import SourceFile
+from parser import Parser
+from parse_cache import ParseCache
+import ast_cache
+from AST import Program, Statement
+
+# "classic" is the original char by char Lexer, "fast" the regex one and "stream" lexes
+# everything up front into a compact TokenStream and hands out a cursor, all give the same tokens
+LEXER_ENGINES: dict[str, Callable] = {
+    "classic": Lexer,
+    "fast": FastLexer,
+    "stream": lambda source: TokenStream(source).cursor(),
+}
+DEFAULT_LEXER_ENGINE = "stream"
+
+# shared by every parse_file in this process, a file parsed again only re-parses the defs that changed
+PARSE_CACHE: ParseCache = ParseCache()
+
+
+def new_lexer(source: str, engine: str = DEFAULT_LEXER_ENGINE):
+    lexer_cls = LEXER_ENGINES.get(engine)
+    if lexer_cls is None:
+        raise ValueError(f"there is no lexer engine called {engine}, pick one of {list(LEXER_ENGINES)}")
+    return lexer_cls(source)
+
+
+def parse_file(path: str, engine: str = DEFAULT_LEXER_ENGINE, cache: ParseCache | None = PARSE_CACHE,
+               use_ast_cache: bool = True) -> tuple[Program, list[str], SourceFile]:
+    """
+    Lexes and parses one file. With the "stream" engine the file is lexed straight
+    out of the mmap, parser errors point into the SourceFile and unchanged top
+    level defs come out of the cache, the other engines get the decoded text.
+
+    With use_ast_cache a file that parsed cleanly before is loaded from its binary
+    AST in the cache dir next to it instead, see ast_cache.
+    """
+    source: SourceFile = SourceFile(path)
+    if use_ast_cache:
+        key: bytes = ast_cache.source_hash(source.data)
+        program: Program | None = ast_cache.load(path, key)
+        if program is not None:
+            return program, [], source
+
+    if engine == "stream":
+        p: Parser = Parser(TokenStream(source).cursor(), source=source, cache=cache)
+    else:
+        p: Parser = Parser(new_lexer(source.text(), engine))
+    program: Program = p.parse_program()
+    if use_ast_cache and len(p.errors) == 0:
+        ast_cache.store(path, key, program)
+    return program, p.errors, source
+
+
+def open_file(path: str, engine: str = DEFAULT_LEXER_ENGINE,
+              use_ast_cache: bool = True) -> tuple[Iterator[Statement], list[str], SourceFile]:
+    """
+    parse_file for the pipeline: the top level statements come out of the iterator
+    as they are parsed (or loaded from the ast cache) and nothing keeps them around
+    after, so compile each one and drop it. errors fills up while iterating, check
+    it before using a statement. No ParseCache here, it would keep every def alive.
+    """
+    source: SourceFile = SourceFile(path)
+    key: bytes | None = None
+    if use_ast_cache:
+        key = ast_cache.source_hash(source.data)
+        statements: Iterator[Statement] | None = ast_cache.load_statements(path, key)
+        if statements is not None:
+            return statements, [], source
+
+    if engine == "stream":
+        p: Parser = Parser(TokenStream(source).cursor(), source=source)
+    else:
+        p: Parser = Parser(new_lexer(source.text(), engine))
+    return parsed_statements(p, path, key), p.errors, source
+
+
+def parsed_statements(p: Parser, path: str, key: bytes | None) -> Iterator[Statement]:
+    # hands the statements on and, if the whole file parsed cleanly, writes the ast cache at the end
+    encoder: ast_cache.Encoder | None = ast_cache.Encoder() if key is not None else None
+    for stm in p.parse_statements():
+        yield stm
+        if encoder is not None:
+            encoder.add(stm)
+    if encoder is not None and len(p.errors) == 0:
+        ast_cache.write(path, key, encoder.finish())
@@ -130,6 +130,8 @@ class Lexer():
                     token = self.__new_token(TokenType.DIVIDE, self.cur_char)
             case '^':
                 token = self.__new_token(TokenType.POW, self.cur_char)
+            case '@':
+                token = self.__new_token(TokenType.AT, self.cur_char)
             case '%':
                 token = self.__new_token(TokenType.PERCENT, self.cur_char)
             case '(':
@@ -147,6 +149,10 @@ class Lexer():
                     ch = self.cur_char
                     self.__read_char()
                     token = self.__new_token(TokenType.LESS_EQ, ch + self.cur_char)
+                elif self.__next_char(1) == '<':
+                    ch = self.cur_char
+                    self.__read_char()
+                    token = self.__new_token(TokenType.SHL, ch + self.cur_char)
                 else:
                     token = self.__new_token(TokenType.LESS, self.cur_char)
             case '>':
@@ -154,6 +160,10 @@ class Lexer():
                     ch = self.cur_char
                     self.__read_char()
                     token = self.__new_token(TokenType.GREATER_EQ, ch + self.cur_char)
+                elif self.__next_char(1) == '>':
+                    ch = self.cur_char
+                    self.__read_char()
+                    token = self.__new_token(TokenType.SHR, ch + self.cur_char)
                 else:
                     token = self.__new_token(TokenType.GREATER, self.cur_char)
             case '=':
@@ -170,6 +180,22 @@ class Lexer():
                     token = self.__new_token(TokenType.NOT_EQ, ch + self.cur_char)
                 else:
                     token = self.__new_token(TokenType.NOT, self.cur_char)
+            case '&':
+                if self.__next_char(1) == '&':
+                    ch = self.cur_char
+                    self.__read_char()
+                    token = self.__new_token(TokenType.AND, ch + self.cur_char)
+                else:
+                    token = self.__new_token(TokenType.BIT_AND, self.cur_char)
+            case '|':
+                if self.__next_char(1) == '|':
+                    ch = self.cur_char
+                    self.__read_char()
+                    token = self.__new_token(TokenType.OR, ch + self.cur_char)
+                else:
+                    token = self.__new_token(TokenType.BIT_OR, self.cur_char)
+            case '~':
+                token = self.__new_token(TokenType.XOR, self.cur_char)
             case ';':
                 token = self.__new_token(TokenType.SEPARATOR, self.cur_char) 
             case ':':
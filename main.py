@@ -2,85 +2,162 @@ import sys
 import os
 from lexer import Lexer
 from parser import Parser
+from Token import TokenType
+from frontend import new_lexer, parse_file, open_file
+from source_file import SourceFile
+from token_stream import TokenStream
 from AST import Program
-import json
+import ast_json
 import time
 from llvmlite import ir
 import llvmlite.binding as llvm
 from ctypes import CFUNCTYPE, c_int, c_float
 from Complier import Compiler
+import optimizer
+from ast_folder import ConstantFolder
+from const_eval import ConstEvaluator
 
 
 
 
 #🤙
 #python main.py test.🤙
+#python main.py test.🤙 -O3
 file_path = sys.argv[1]
 
 LEXER_DEBUG = False
+LEXER_ENGINE = "stream" # mmaps the file into a compact token stream, "fast"/"classic" lex the decoded text
+PIPELINE = True # compile top level statements while parsing instead of building the whole Program first
 PARSER_DEBUG = True
+PARSER_DEBUG_LINES = False # also write debug/ast.jsonl, one compact top level statement per line
+FOLD_CONSTANTS = True # fold literal math and drop dead branches on the AST before compiling
+DROP_UNUSED_DEFS = True # only compile defs reachable from main and exports, imports included
+CONST_EVAL = True # run calls to pure defs with constant args at compile time
+FAST_MATH = False # fast-math flags on every float op of every def, @fastmath turns them on for one def
 COMPILER_DEBUG = True
 RUN_CODE = True
+OPT_LEVEL = optimizer.DEFAULT_OPT_LEVEL # O0 - O3, Os or Oz, -O<level> on the command line wins
+OPT_DEBUG = True # print what the optimizer did and write debug/ir_opt.ll
+for arg in sys.argv[2:]:
+    if arg.startswith("-O"):
+        OPT_LEVEL = arg[1:]
+if OPT_LEVEL not in optimizer.OPT_LEVELS:
+    print(f"what the fuck is -{OPT_LEVEL}, pick one of {', '.join('-' + level for level in optimizer.OPT_LEVELS)}")
+    exit()
 if __name__ == "__main__":
-    with open(file_path, "r") as f:
-        code = f.read()
+    if LEXER_DEBUG:
+        source = SourceFile(file_path)
+        lexer = TokenStream(source).cursor() if LEXER_ENGINE == "stream" else new_lexer(source.text(), LEXER_ENGINE)
+        token = lexer.next_token()
+        while token.type != TokenType.EOF:
+            print(token)
+            token = lexer.next_token()
+
+    if PIPELINE:
+        # every top level statement is compiled as soon as it's parsed and then dropped
+        statements, errors, source = open_file(file_path, LEXER_ENGINE)
+        folder: ConstantFolder | None = ConstantFolder() if FOLD_CONSTANTS else None
+        compiler: Compiler = Compiler(lexer_engine=LEXER_ENGINE, source=source, folder=folder, drop_unused=DROP_UNUSED_DEFS,
+                                      const_eval=ConstEvaluator() if CONST_EVAL else None, fast_math=FAST_MATH)
+        if PARSER_DEBUG:
+            print("----------------parser debug----------------")
+            ast_file = open("./debug/ast.json", "w")
+            lines_file = open("./debug/ast.jsonl", "w") if PARSER_DEBUG_LINES else None
+            dump = ast_json.ProgramDump(ast_file, indent=4, lines=lines_file)
+
+        for stm in statements:
+            if len(errors) > 0:
+                break
+            if PARSER_DEBUG:
+                dump.add(stm)
+            if folder is not None:
+                stm = folder.fold(stm)
+                if stm is None:
+                    continue
+            compiler.compile(node=stm)
 
-        if LEXER_DEBUG:
-            lexer = Lexer(code)
-            while lexer.cur_char is not None:
-                print(lexer.next_token())
-        
-        l: Lexer = Lexer(source=code)
-        p: Parser = Parser(lexer=l)
-        program: Program = p.parse_program()
-        if len(p.errors) > 0:
-            for e in p.errors:
+        if PARSER_DEBUG:
+            dump.close()
+            ast_file.close()
+            if lines_file is not None:
+                lines_file.close()
+            print("----------------parser debug end------------")
+        if len(errors) > 0:
+            for e in errors:
                 print(e)
             exit()
-        
+    else:
+        program, errors, source = parse_file(file_path, LEXER_ENGINE)
+        if len(errors) > 0:
+            for e in errors:
+                print(e)
+            exit()
+
         if PARSER_DEBUG:
             print("----------------parser debug----------------")
             with open("./debug/ast.json", "w") as f:
-                json.dump(program.json(), f, indent=4)
+                ast_json.dump(program, f, indent=4)
+            if PARSER_DEBUG_LINES:
+                with open("./debug/ast.jsonl", "w") as f:
+                    ast_json.dump_lines(program, f)
 
             print("----------------parser debug end------------")
-        
-        compiler: Compiler = Compiler()
+
+        folder: ConstantFolder | None = ConstantFolder() if FOLD_CONSTANTS else None
+        if folder is not None:
+            program = folder.fold(program)
+        compiler: Compiler = Compiler(lexer_engine=LEXER_ENGINE, source=source, folder=folder, drop_unused=DROP_UNUSED_DEFS,
+                                      const_eval=ConstEvaluator() if CONST_EVAL else None, fast_math=FAST_MATH)
         compiler.compile(node=program)
 
-        module: ir.Module = compiler.module
-        module.triple = llvm.get_default_triple()
-
-        if COMPILER_DEBUG:
-            print("----------------compiler debug-------------")
-            with open("./debug/ir.ll", "w") as f:
-                f.write(str(module))
-            print("----------------compiler debug end---------")
-
-        if RUN_CODE:
-            print("----------------running code-------------")
-            llvm.initialize()
-            llvm.initialize_native_target()
-            llvm.initialize_native_asmprinter()
-
-            try:
-                llvm_ir_parsed = llvm.parse_assembly(str(module))
-                llvm_ir_parsed.verify()
-            except Exception as e:
-                print(e)
-                exit()
-            
-            tgt_machine = llvm.Target.from_default_triple().create_target_machine()
-            engine = llvm.create_mcjit_compiler(llvm_ir_parsed, tgt_machine)
-            engine.finalize_object()
-
-            entry = engine.get_function_address("main")
-            cfunc = CFUNCTYPE(c_int)(entry)
-            st = time.time()
-            res = cfunc()
-            ed = time.time()
-
-            print(f"\n Program returned fucking {res} \n finished in {round((ed - st) * 1000,6)} ms, you NEED to optimize your code dumbass")
+    module: ir.Module = compiler.module
+    module.triple = llvm.get_default_triple()
+
+    if COMPILER_DEBUG:
+        print("----------------compiler debug-------------")
+        if folder is not None:
+            print(folder.report())
+        if DROP_UNUSED_DEFS:
+            print(compiler.unused_report())
+        if compiler.const_eval is not None:
+            print(compiler.const_eval.report())
+        print(compiler.resolver.report())
+        for e in compiler.errors:
+            print(e)
+        with open("./debug/ir.ll", "w") as f:
+            f.write(str(module))
+        print("----------------compiler debug end---------")
+
+    if RUN_CODE:
+        print("----------------running code-------------")
+        llvm.initialize()
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+
+        try:
+            llvm_ir_parsed = llvm.parse_assembly(str(module))
+            llvm_ir_parsed.verify()
+        except Exception as e:
+            print(e)
+            exit()
+        
+        tgt_machine = llvm.Target.from_default_triple().create_target_machine(opt=optimizer.OPT_LEVELS[OPT_LEVEL][0])
+        report: optimizer.OptimizationReport = optimizer.optimize(llvm_ir_parsed, OPT_LEVEL, tgt_machine)
+        if OPT_DEBUG:
+            print(report)
+            with open("./debug/ir_opt.ll", "w") as f:
+                f.write(str(llvm_ir_parsed))
+
+        engine = llvm.create_mcjit_compiler(llvm_ir_parsed, tgt_machine)
+        engine.finalize_object()
+
+        entry = engine.get_function_address("main")
+        cfunc = CFUNCTYPE(c_int)(entry)
+        st = time.time()
+        res = cfunc()
+        ed = time.time()
+
+        print(f"\n Program returned fucking {res} \n finished in {round((ed - st) * 1000,6)} ms, you NEED to optimize your code dumbass")
 
 
 
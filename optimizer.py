@@ -0,0 +1,92 @@
+from collections import Counter
+import llvmlite.binding as llvm
+
+# name -> (speed level, size level), same meaning as clang's -O flags
+OPT_LEVELS: dict[str, tuple[int, int]] = {
+    "O0": (0, 0),
+    "O1": (1, 0),
+    "O2": (2, 0),
+    "O3": (3, 0),
+    "Os": (2, 1),
+    "Oz": (2, 2),
+}
+DEFAULT_OPT_LEVEL = "O2"
+
+
+class IRStats():
+    """ How big a module is: instructions per function and per opcode """
+    def __init__(self, module: llvm.ModuleRef):
+        self.functions: dict[str, int] = {}
+        self.blocks = 0
+        self.opcodes: Counter = Counter()
+        for fn in module.functions:
+            if fn.is_declaration:
+                continue
+            count = 0
+            for block in fn.blocks:
+                self.blocks += 1
+                for instr in block.instructions:
+                    self.opcodes[instr.opcode] += 1
+                    count += 1
+            self.functions[fn.name] = count
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.functions.values())
+
+
+class OptimizationReport():
+    def __init__(self, level: str, before: IRStats, after: IRStats):
+        self.level = level
+        self.before = before
+        self.after = after
+
+    def shrink(self) -> float:
+        if self.before.instructions == 0:
+            return 0.0
+        return 1 - self.after.instructions / self.before.instructions
+
+    def __str__(self):
+        before, after = self.before, self.after
+        lines = [
+            f"-{self.level}: {before.instructions} -> {after.instructions} instructions ({self.shrink():.1%} smaller), "
+            f"{before.blocks} -> {after.blocks} blocks, {len(before.functions)} -> {len(after.functions)} functions"
+        ]
+        # the opcodes that moved the most, allocas/loads/stores going away is mem2reg doing its thing
+        deltas = {op: after.opcodes[op] - before.opcodes[op] for op in before.opcodes | after.opcodes}
+        changed = sorted((op for op, delta in deltas.items() if delta != 0), key=lambda op: (deltas[op], op))
+        if changed:
+            lines.append("  " + ", ".join(f"{op} {before.opcodes[op]} -> {after.opcodes[op]}" for op in changed))
+        gone = [name for name in before.functions if name not in after.functions]
+        if gone:
+            lines.append(f"  gone (inlined or dead): {', '.join(gone)}")
+        for name, count in after.functions.items():
+            if name in before.functions and before.functions[name] != count:
+                lines.append(f"  {name}: {before.functions[name]} -> {count}")
+        return "\n".join(lines)
+
+
+def optimize(module: llvm.ModuleRef, level: str = DEFAULT_OPT_LEVEL,
+             target_machine: llvm.TargetMachine | None = None) -> OptimizationReport:
+    """
+    Runs LLVM's default pipeline for level over the parsed module in place and
+    reports what it did. O0 leaves the module alone.
+    """
+    if level not in OPT_LEVELS:
+        raise ValueError(f"there is no optimization level called {level}, pick one of {list(OPT_LEVELS)}")
+    speed_level, size_level = OPT_LEVELS[level]
+
+    before: IRStats = IRStats(module)
+    if speed_level > 0:
+        if target_machine is None:
+            target_machine = llvm.Target.from_default_triple().create_target_machine(opt=speed_level)
+        # llvmlite's Os pipeline (size level 1) hits an UNREACHABLE and kills the process, so Os is
+        # O2 without the loop passes that grow code, Oz is fine as is
+        pto = llvm.create_pipeline_tuning_options(speed_level=speed_level, size_level=0 if size_level == 1 else size_level)
+        # size levels don't want the code growth from unrolling and vectorizing
+        pto.loop_unrolling = size_level == 0
+        pto.loop_vectorization = size_level == 0
+        pto.slp_vectorization = size_level == 0
+        pass_builder = llvm.create_pass_builder(target_machine, pto)
+        pass_builder.getModulePassManager().run(module, pass_builder)
+    return OptimizationReport(level, before, IRStats(module))
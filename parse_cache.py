@@ -0,0 +1,38 @@
+from hashlib import blake2b
+from AST import DefStatement
+
+
+class ParseCache():
+    """
+    Parsed top level defs by a hash of their source text. A Parser given a cache
+    reuses the DefStatement of every def whose text didn't change and only parses
+    the rest. Cached subtrees are shared between programs, so nobody gets to mutate
+    them. Only defs that parsed without errors end up in here.
+    """
+    def __init__(self, max_entries: int = 1 << 16):
+        self.max_entries = max_entries
+        self.defs: dict[bytes, DefStatement] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: bytes) -> bytes:
+        return blake2b(text, digest_size=16).digest()
+
+    def get(self, key: bytes) -> DefStatement | None:
+        stm = self.defs.pop(key, None)
+        if stm is None:
+            self.misses += 1
+            return None
+        # put it back at the end, the oldest entries are the ones that get dropped
+        self.defs[key] = stm
+        self.hits += 1
+        return stm
+
+    def put(self, key: bytes, stm: DefStatement):
+        self.defs[key] = stm
+        if len(self.defs) > self.max_entries:
+            del self.defs[next(iter(self.defs))]
+
+    def __len__(self):
+        return len(self.defs)
@@ -1,21 +1,30 @@
 from Token import Token, TokenType
 from lexer import Lexer
+from source_file import SourceFile
+from token_stream import TokenCursor
+from parse_cache import ParseCache
 from enum import Enum, auto
 from typing import Callable
 
 from AST import Statement, Expression,Program
-from AST import ExpressionStatement, VarStatement, DefStatement, BlockStatement, ReturnStatement, AssignmentStatement, IfStatement, WhileStatement, BreakStatement, ForStatement, ContinueStatement, ImportStatement
+from AST import ExpressionStatement, VarStatement, DefStatement, BlockStatement, ReturnStatement, AssignmentStatement, IfStatement, WhileStatement, BreakStatement, ForStatement, ContinueStatement, ImportStatement, MatchStatement
 from AST import InfixExpression, CallExpression, PrefixExpression
 from AST import IntLiteral, FloatLiteral, IdentifierLiteral, BoolLiteral, StringLiteral
-from AST import DefParam
+from AST import DefParam, LoopHint, MatchCase
 
 
 
 class Precedence(Enum):
 
     P_LOWEST = 0
+    P_OR = auto()
+    P_AND = auto()
     P_EQUAL = auto()
     P_LESSGREATER = auto()
+    P_BIT_OR = auto()
+    P_BIT_XOR = auto()
+    P_BIT_AND = auto()
+    P_SHIFT = auto()
     P_SUM = auto()
     P_PRODUCT = auto()
     P_EXPONENT = auto()
@@ -36,13 +45,51 @@ PRECEDENCES : dict[TokenType, Precedence] = {
     TokenType.GREATER: Precedence.P_LESSGREATER,
     TokenType.LESS_EQ: Precedence.P_LESSGREATER,
     TokenType.GREATER_EQ: Precedence.P_LESSGREATER,
+    # bit ops bind tighter than comparisons, x & 1 == 0 is (x & 1) == 0
+    TokenType.BIT_OR: Precedence.P_BIT_OR,
+    TokenType.XOR: Precedence.P_BIT_XOR,
+    TokenType.BIT_AND: Precedence.P_BIT_AND,
+    TokenType.SHL: Precedence.P_SHIFT,
+    TokenType.SHR: Precedence.P_SHIFT,
+    TokenType.AND: Precedence.P_AND,
+    TokenType.OR: Precedence.P_OR,
     TokenType.LPAREN: Precedence.P_CALL,
 
 }
 
+# prefix operators, they wrap whatever comes after them at P_PREFIX
+PREFIX_OPERATORS: set[TokenType] = {TokenType.MINUS, TokenType.NOT}
+# @name or @name(n) in front of a loop -> (least, most) numbers it takes in the parens
+LOOP_HINTS: dict[str, tuple[int, int]] = {
+    "unroll": (0, 1),
+    "nounroll": (0, 0),
+    "vectorize": (0, 1),
+    "novectorize": (0, 0),
+    "interleave": (1, 1),
+}
+# @name in front of a def
+DEF_HINTS: set[str] = {"fastmath"}
+
+# operators that also have a word for them, the AST always gets the symbol
+OPERATOR_SYMBOLS: dict[TokenType, str] = {
+    TokenType.AND: "&&",
+    TokenType.OR: "||",
+}
+
+# 2 ^ 3 ^ 2 is 2 ^ (3 ^ 2), the right side is parsed one level looser so another ^ still binds there
+RIGHT_ASSOCIATIVE: set[TokenType] = {TokenType.POW}
+
+# what a waiting expression on the __parse_expression stack does with the result of its right side
+K_INFIX = 0
+K_PREFIX = 1
+K_GROUP = 2
+K_CALL = 3
+
 class Parser():
-    def __init__(self, lexer):
+    def __init__(self, lexer, source: SourceFile = None, cache: ParseCache = None):
         self.lexer: Lexer = lexer
+        self.source: SourceFile | None = source # only when the lexer's places are offsets into it
+        self.cache: ParseCache | None = cache # only used when the lexer is a TokenCursor
         self.errors: list[str] = []
 
         self.cur_token: Token = None
@@ -52,29 +99,10 @@ class Parser():
             TokenType.IDENTIFIER: self.__parse_identifier,
             TokenType.INT: self.__parse_int_literal,
             TokenType.FLOAT: self.__parse_float_literal,
-            TokenType.LPAREN: self.__parse_group_expression,
             TokenType.IF: self.__parse_if_statement,
             TokenType.TRUE: self.__parse_bool,
             TokenType.FALSE: self.__parse_bool,
             TokenType.STRING: self.__parse_string_literal,
-            TokenType.MINUS: self.__parse_prefix_expression,
-            TokenType.NOT: self.__parse_prefix_expression,
-
-        } 
-        self.infix_parse_fn: dict[TokenType, Callable] = {
-            TokenType.PLUS: self.__parse_infix_expression,
-            TokenType.MINUS: self.__parse_infix_expression,
-            TokenType.MULTIPLY: self.__parse_infix_expression,
-            TokenType.DIVIDE: self.__parse_infix_expression,
-            TokenType.POW: self.__parse_infix_expression,
-            TokenType.PERCENT: self.__parse_infix_expression,
-            TokenType.DOUBLE_EQ: self.__parse_infix_expression,
-            TokenType.NOT_EQ: self.__parse_infix_expression,
-            TokenType.LESS: self.__parse_infix_expression,
-            TokenType.GREATER: self.__parse_infix_expression,
-            TokenType.LESS_EQ: self.__parse_infix_expression,
-            TokenType.GREATER_EQ: self.__parse_infix_expression,
-            TokenType.LPAREN: self.__parse_call_expression,
 
         } 
 
@@ -93,12 +121,6 @@ class Parser():
     def __cur_token_is(self, type_: TokenType):
         return self.cur_token.type == type_
     
-    def __cur_precedence(self):
-        prec: Precedence | None =  PRECEDENCES.get(self.cur_token.type)
-        if prec == None:
-            prec = Precedence.P_LOWEST
-        return prec
-    
     def __next_precedence(self):
         prec: Precedence | None =  PRECEDENCES.get(self.next_token.type)
         if prec == None:
@@ -117,24 +139,40 @@ class Parser():
         ass_ops: list[TokenType] = [TokenType.EQ, TokenType.PLUS_EQ, TokenType.MUL_EQ, TokenType.MINUS_EQ, TokenType.DIV_EQ]
         return self.next_token.type in ass_ops
     
+    def __where(self, token: Token):
+        if self.source is None:
+            return f"row {token.row}"
+        return self.source.describe(token.place)
+
     def __expect_error(self, type_: TokenType):
-        self.errors.append(f"expected the next fucking token to be fucking {type_} but got fucking {self.next_token.type} instead")
+        self.errors.append(f"expected the next fucking token to be fucking {type_} but got fucking {self.next_token.type} instead at {self.__where(self.next_token)}")
 
     def __no_prefix_prase_fn_error(self, type_: TokenType):
-        self.errors.append(f"no stupid prefix parse function found for {type_}, you are EXTREAMLY stupid")
+        self.errors.append(f"no stupid prefix parse function found for {type_} at {self.__where(self.cur_token)}, you are EXTREAMLY stupid")
 
     #endregion
 
     def parse_program(self):
         program: Program = Program()
+        program.statements.extend(self.parse_statements())
+        return program
+
+    def parse_statements(self):
+        """
+        Yields the top level statements one at a time as they are parsed, so a caller
+        can compile each one and drop it before the next is even parsed. Check
+        errors before using a statement, it may be half built.
+        """
+        cached: bool = self.cache is not None and isinstance(self.lexer, TokenCursor)
         while self.cur_token.type != TokenType.EOF:
-            stm: Statement = self.__parse_statement()
-            if stm is not None:
-                program.statements.append(stm)
+            if cached and self.cur_token.type == TokenType.DEF:
+                stm: Statement = self.__parse_cached_def_statement()
+            else:
+                stm: Statement = self.__parse_statement()
 
             self.__next_token()
-
-        return program
+            if stm is not None:
+                yield stm
     
     def __parse_statement(self):
         if self.__cur_token_is(TokenType.IDENTIFIER) and self.__next_toke_is_assign():
@@ -157,6 +195,14 @@ class Parser():
                 return self.__parse_continue_statement()
             case TokenType.IMPORT:
                 return self.__parse_import_statement()
+            case TokenType.AT if self.next_token.literal in DEF_HINTS:
+                return self.__parse_hinted_def()
+            case TokenType.AT:
+                return self.__parse_hinted_loop()
+            case TokenType.EXPORT:
+                return self.__parse_export_statement()
+            case TokenType.MATCH:
+                return self.__parse_match_statement()
             case _:
                 return self.__parse_statement_expression()
             
@@ -178,6 +224,59 @@ class Parser():
         self.__next_token()
         return ContinueStatement()
     
+    def __parse_hinted_def(self):
+        # @fastmath def name() -> float { ... }, or @fastmath export def
+        self.__next_token()
+        hint: str = self.cur_token.literal
+        self.__next_token()
+        match self.cur_token.type:
+            case TokenType.DEF:
+                def_stm: DefStatement | None = self.__parse_def_statement()
+            case TokenType.EXPORT:
+                def_stm: DefStatement | None = self.__parse_export_statement()
+            case _:
+                self.errors.append(f"@{hint} only goes in front of a def, not {self.cur_token.type} at {self.__where(self.cur_token)}")
+                return None
+        if def_stm is not None:
+            def_stm.fastmath = True
+        return def_stm
+
+    def __parse_hinted_loop(self):
+        # @unroll(4) @vectorize(8) for (...) { ... }
+        hints: list[LoopHint] = []
+        while self.__cur_token_is(TokenType.AT):
+            if not self.__expect_next(TokenType.IDENTIFIER):
+                return None
+            hint: LoopHint = LoopHint(name=self.cur_token.literal)
+            if hint.name not in LOOP_HINTS:
+                self.errors.append(f"what the fuck is @{hint.name} at {self.__where(self.cur_token)}, loops only take {', '.join('@' + name for name in LOOP_HINTS)}")
+                return None
+            least, most = LOOP_HINTS[hint.name]
+            if most > 0 and self.__next_token_is(TokenType.LPAREN):
+                self.__next_token()
+                if not self.__expect_next(TokenType.INT):
+                    return None
+                hint.value = int(self.cur_token.literal)
+                if not self.__expect_next(TokenType.RPAREN):
+                    return None
+            elif least > 0:
+                self.__expect_error(TokenType.LPAREN)
+                return None
+            hints.append(hint)
+            self.__next_token()
+
+        match self.cur_token.type:
+            case TokenType.FOR:
+                loop: ForStatement | None = self.__parse_for_statement()
+            case TokenType.WHILE:
+                loop: WhileStatement | None = self.__parse_while_statement()
+            case _:
+                self.errors.append(f"@{hints[-1].name} only goes in front of a loop dumbass, not {self.cur_token.type} at {self.__where(self.cur_token)}")
+                return None
+        if loop is not None:
+            loop.hints = hints
+        return loop
+
     def __parse_for_statement(self):
         for_stm: ForStatement = ForStatement()
         if not self.__expect_next(TokenType.LPAREN):
@@ -209,6 +308,41 @@ class Parser():
         return while_stm
 
     
+    def __parse_match_statement(self):
+        # match x { case 1, 2 { ... } case 3 { ... } default { ... } }, no fallthrough between cases
+        match_stm: MatchStatement = MatchStatement()
+        self.__next_token()
+        match_stm.subject = self.__parse_expression(Precedence.P_LOWEST)
+        if not self.__expect_next(TokenType.LBRACE):
+            return None
+        self.__next_token()
+        while not self.__cur_token_is(TokenType.RBRACE):
+            match self.cur_token.type:
+                case TokenType.CASE:
+                    match_case: MatchCase = MatchCase()
+                    self.__next_token()
+                    match_case.values.append(self.__parse_expression(Precedence.P_LOWEST))
+                    while self.__next_token_is(TokenType.COMMA):
+                        self.__next_token()
+                        self.__next_token()
+                        match_case.values.append(self.__parse_expression(Precedence.P_LOWEST))
+                    if not self.__expect_next(TokenType.LBRACE):
+                        return None
+                    match_case.block = self.__parse_block_statement()
+                    match_stm.cases.append(match_case)
+                case TokenType.DEFAULT:
+                    if match_stm.default is not None:
+                        self.errors.append(f"a match gets one default, not two, at {self.__where(self.cur_token)}")
+                        return None
+                    if not self.__expect_next(TokenType.LBRACE):
+                        return None
+                    match_stm.default = self.__parse_block_statement()
+                case _:
+                    self.errors.append(f"only case and default go in a match you donut, not {self.cur_token.type} at {self.__where(self.cur_token)}")
+                    return None
+            self.__next_token()
+        return match_stm
+
     def __parse_statement_expression(self):
         expr = self.__parse_expression(Precedence.P_LOWEST)
 
@@ -259,6 +393,15 @@ class Parser():
 
 
     
+    def __parse_export_statement(self):
+        # export def name() -> int { ... }
+        if not self.__expect_next(TokenType.DEF):
+            return None
+        def_stm: DefStatement | None = self.__parse_def_statement()
+        if def_stm is not None:
+            def_stm.exported = True
+        return def_stm
+
     def __parse_def_statement(self):
         def_stm: DefStatement = DefStatement()
         # def name() -> int { return x; }
@@ -288,6 +431,29 @@ class Parser():
 
         return def_stm
     
+    def __parse_cached_def_statement(self):
+        # a top level def, reused from the cache when its source text is the same as last time
+        stream = self.lexer.stream
+        first = self.lexer.index - 2
+        last = stream.closing_brace(first)
+        if last == -1:
+            return self.__parse_def_statement()
+
+        key = ParseCache.key(stream.span(first, last))
+        def_stm: DefStatement | None = self.cache.get(key)
+        if def_stm is not None:
+            # leave the tokens where __parse_def_statement would, on the closing }
+            self.lexer.seek(last)
+            self.__next_token()
+            self.__next_token()
+            return def_stm
+
+        error_count = len(self.errors)
+        def_stm = self.__parse_def_statement()
+        if def_stm is not None and len(self.errors) == error_count and self.lexer.index - 2 == last:
+            self.cache.put(key, def_stm)
+        return def_stm
+
     def __parse_def_params(self):
         params: list[DefParam] = []
         if self.__next_token_is(TokenType.RPAREN):
@@ -361,81 +527,99 @@ class Parser():
         return if_stm
 
     def __parse_expression(self, precedence: Precedence):
-        prefix_fn: Callable | None = self.prefix_parse_fn.get(self.cur_token.type) 
-
-        if prefix_fn is None:
-            self.__no_prefix_prase_fn_error(self.cur_token.type)
-            return None
-        
-        left_expr: Expression = prefix_fn()
-        while not self.__next_token_is(TokenType.SEPARATOR) and precedence.value < self.__next_precedence().value:
-            infix_fn: Callable | None = self.infix_parse_fn.get(self.next_token.type)
-            if infix_fn is None:
-                return left_expr
-            
-            self.__next_token()
-
-            left_expr = infix_fn(left_expr)
-
-        return left_expr
-
-    def __parse_infix_expression(self, l_node: Expression):
-        infix: InfixExpression = InfixExpression(l_node=l_node, op=self.cur_token.literal)
-
-        precedence = self.__cur_precedence()
-
-        self.__next_token()
-
-        infix.r_node = self.__parse_expression(precedence)
+        """
+        Precedence climbing with its own stack instead of recursion, so long operator
+        chains and deep parens don't run into the recursion limit. Every entry on the
+        stack is an expression still waiting for its right side: (precedence the
+        waiting expression was parsed at, what to do with the result, the node).
+        """
+        stack: list[tuple[int, int, Expression, list | None]] = []
+        prec: int = precedence.value
+
+        while True:
+            # parse one prefix at precedence prec, operators and parens open a new level
+            type_ = self.cur_token.type
+            if type_ == TokenType.LPAREN:
+                self.__next_token()
+                stack.append((prec, K_GROUP, None, None))
+                prec = Precedence.P_LOWEST.value
+                continue
+            if type_ in PREFIX_OPERATORS:
+                pref: PrefixExpression = PrefixExpression(op=self.cur_token.literal)
+                self.__next_token()
+                stack.append((prec, K_PREFIX, pref, None))
+                prec = Precedence.P_PREFIX.value
+                continue
+
+            prefix_fn: Callable | None = self.prefix_parse_fn.get(type_)
+            if prefix_fn is None:
+                self.__no_prefix_prase_fn_error(type_)
+                left_expr: Expression = None
+                done = True
+            else:
+                left_expr: Expression = prefix_fn()
+                done = False
+
+            # eat infix operators binding tighter than prec, then hand the result down the stack
+            while True:
+                opened = False
+                while not done and self.next_token.type != TokenType.SEPARATOR:
+                    next_prec: Precedence = self.__next_precedence()
+                    if prec >= next_prec.value:
+                        break
+                    self.__next_token()
+
+                    if self.cur_token.type == TokenType.LPAREN:
+                        call_: CallExpression = CallExpression(def_=left_expr)
+                        if self.__next_token_is(TokenType.RPAREN):
+                            self.__next_token()
+                            call_.args = []
+                            left_expr = call_
+                            continue
+                        self.__next_token()
+                        stack.append((prec, K_CALL, call_, []))
+                        prec = Precedence.P_LOWEST.value
+                    else:
+                        op: str = OPERATOR_SYMBOLS.get(self.cur_token.type, self.cur_token.literal)
+                        infix: InfixExpression = InfixExpression(l_node=left_expr, op=op)
+                        right_assoc: bool = self.cur_token.type in RIGHT_ASSOCIATIVE
+                        self.__next_token()
+                        stack.append((prec, K_INFIX, infix, None))
+                        prec = next_prec.value - 1 if right_assoc else next_prec.value
+                    opened = True
+                    break
+
+                if opened:
+                    break
+                if not stack:
+                    return left_expr
+
+                prec, kind, node, args = stack.pop()
+                done = False
+                if kind == K_INFIX or kind == K_PREFIX:
+                    node.r_node = left_expr
+                    left_expr = node
+                elif kind == K_GROUP:
+                    if not self.__expect_next(TokenType.RPAREN):
+                        left_expr = None
+                else:
+                    args.append(left_expr)
+                    if self.__next_token_is(TokenType.COMMA):
+                        self.__next_token()
+                        self.__next_token()
+                        stack.append((prec, K_CALL, node, args))
+                        prec = Precedence.P_LOWEST.value
+                        break
+                    node.args = args if self.__expect_next(TokenType.RPAREN) else None
+                    left_expr = node
 
-        return infix
-    
-    def __parse_call_expression(self, def_: Expression):
-        call_: CallExpression = CallExpression(def_=def_)
-        call_.args = self.__parse_expr_list(TokenType.RPAREN)
-        return call_
-    
-    def __parse_expr_list(self, end: TokenType):
-        args: list[Expression] = []
-        if self.__next_token_is(end):
-            self.__next_token()
-            return args
-        
-        self.__next_token()
-
-        args.append(self.__parse_expression(Precedence.P_LOWEST))
-        while self.__next_token_is(TokenType.COMMA):
-            self.__next_token()
-            self.__next_token()
-            args.append(self.__parse_expression(Precedence.P_LOWEST))
-
-        if not self.__expect_next(end):
-            return None
-        return args
-        
-    
-    def __parse_group_expression(self):
-        self.__next_token()
-
-        expr: Expression = self.__parse_expression(Precedence.P_LOWEST)
-        if not self.__expect_next(TokenType.RPAREN):
-            return None
-        
-        return expr
-    
-    def __parse_prefix_expression(self):
-        pref: PrefixExpression = PrefixExpression(op = self.cur_token.literal)
-        self.__next_token()
-        pref.r_node = self.__parse_expression(Precedence.P_PREFIX)
-        return pref
-    
     def __parse_int_literal(self):
         int_node: IntLiteral = IntLiteral()
 
         try:
             int_node.int = int(self.cur_token.literal)
         except:
-            self.errors.append(f"That shit is NOT an int, just look at it {self.cur_token.literal}")
+            self.errors.append(f"That shit is NOT an int, just look at it {self.cur_token.literal} at {self.__where(self.cur_token)}")
             return None
         
         return int_node
@@ -446,7 +630,7 @@ class Parser():
         try:
             float_node.float = float(self.cur_token.literal)
         except:
-            self.errors.append(f"Never in ANY fucking circumstaces thats a float, look at if {self.cur_token.literal}")
+            self.errors.append(f"Never in ANY fucking circumstaces thats a float, look at if {self.cur_token.literal} at {self.__where(self.cur_token)}")
             return None
         
         return float_node
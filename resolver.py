@@ -0,0 +1,124 @@
+from AST import Node, NodeType, iter_children
+from AST import DefStatement, IdentifierLiteral
+
+# nodes the compiler opens a scope for inside a def, the def's own scope has its params
+SCOPES = {NodeType.BLOCK_STATEMENT, NodeType.FOR_STATEMENT}
+
+# what to do with a node on the resolve stack
+VISIT = 0
+DECLARE = 1 # a var's name, after its value
+LEAVE = 2 # the scope of the node is done
+
+
+class Symbols():
+    """ Interns names, every distinct name gets one small int for as long as the compiler lives """
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.names: list[str] = []
+
+    def intern(self, name: str) -> int:
+        symbol: int | None = self.ids.get(name)
+        if symbol is None:
+            symbol = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+
+class Resolver():
+    """
+    Binds every local of a def to where the compiler will keep it, once per def
+    before any code for it: (depth, slot) is the slot-th local of the scope
+    depth levels down from the def's own scope (0, its params). The compiler keeps
+    a list of slots per open scope and finds a local with two index operations
+    instead of walking a chain of dicts by name.
+
+    Goes through the def in the order the compiler does, so what a name means is
+    the same: a var whose name is already visible reuses that local, and names
+    that aren't locals at all (defs, print, true/false) stay unbound for the
+    compiler to look up by name. Nested defs are left for when they get compiled.
+    """
+    def __init__(self):
+        self.symbols: Symbols = Symbols()
+        self.bound = 0 # identifiers bound to a slot
+        self.unbound = 0 # identifiers left for the name lookup
+
+    def resolve(self, node: DefStatement) -> tuple[dict[IdentifierLiteral, tuple[int, int]], dict[Node, int]]:
+        """
+        (depth, slot) of every identifier in node that is a local, vars' names
+        included, and how many slots each scope node needs.
+        """
+        bindings: dict[IdentifierLiteral, tuple[int, int]] = {}
+        sizes: dict[Node, int] = {}
+        # symbol -> (depth, slot) of every local it names that's still open, innermost last
+        visible: dict[int, list[tuple[int, int]]] = {}
+        # symbols declared per open scope, for taking them back out when it's left
+        scopes: list[list[int]] = []
+        intern = self.symbols.intern
+
+        def declare(symbol: int):
+            depth: int = len(scopes) - 1
+            binding: tuple[int, int] = (depth, len(scopes[-1]))
+            scopes[-1].append(symbol)
+            visible.setdefault(symbol, []).append(binding)
+            return binding
+
+        scopes.append([])
+        for param in node.params:
+            declare(intern(param.name))
+
+        stack: list[tuple[int, Node]] = [(LEAVE, node), (VISIT, node.block)]
+        while stack:
+            action, current = stack.pop()
+            if action == LEAVE:
+                declared: list[int] = scopes.pop()
+                sizes[current] = len(declared)
+                for symbol in declared:
+                    visible[symbol].pop()
+                continue
+            if action == DECLARE:
+                name: IdentifierLiteral = current.name
+                symbol: int = intern(name.value)
+                if visible.get(symbol):
+                    # var on a name that's already there just stores into it
+                    bindings[name] = visible[symbol][-1]
+                else:
+                    bindings[name] = declare(symbol)
+                self.bound += 1
+                continue
+
+            kind: NodeType = current.kind
+            if kind == NodeType.INDENTIFIER_LITERAL:
+                candidates: list[tuple[int, int]] | None = visible.get(intern(current.value))
+                if candidates:
+                    bindings[current] = candidates[-1]
+                    self.bound += 1
+                else:
+                    self.unbound += 1
+                continue
+            if kind == NodeType.DEF_STATEMENT:
+                # a def in a def gets resolved on its own when it's compiled
+                continue
+
+            if kind in SCOPES:
+                scopes.append([])
+                stack.append((LEAVE, current))
+            # pushed backwards so they come off the stack in the compiler's order
+            match kind:
+                case NodeType.VAR_STATEMENT:
+                    stack.append((DECLARE, current))
+                    stack.append((VISIT, current.value))
+                case NodeType.FOR_STATEMENT:
+                    # the step is compiled after the body, in the loop's scope
+                    stack.extend((VISIT, child) for child in (current.op, current.block, current.condition, current.var_decl) if child is not None)
+                case NodeType.CALL_EXPRESSION:
+                    # the name of the def isn't a local
+                    stack.extend((VISIT, arg) for arg in reversed(current.args))
+                case _:
+                    children: list[Node] = list(iter_children(current))
+                    children.reverse()
+                    stack.extend((VISIT, child) for child in children)
+
+        return bindings, sizes
+
+    def report(self) -> str:
+        return f"name resolution: {self.bound} identifiers bound to slots, {self.unbound} looked up by name, {len(self.symbols.names)} symbols"
@@ -0,0 +1,55 @@
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+
+NEWLINE_RE = re.compile(rb"\n")
+
+
+class SourceFile():
+    """
+    One source file, mmapped read only and never decoded as a whole. Keeps a table
+    of line start offsets so any byte offset turns into (line, column) with a
+    binary search. Lexer, parser and compiler all report positions through this.
+    """
+    def __init__(self, path: str, data=None):
+        self.path = path
+        self.__mmap: mmap.mmap | None = None
+
+        if data is None:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size > 0:
+                    self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self.__mmap if self.__mmap is not None else b""
+
+        self.data = data
+        self.view = memoryview(data)
+        self.line_starts: array = array('I', [0])
+        self.line_starts.extend(m.end() for m in NEWLINE_RE.finditer(data))
+
+    @classmethod
+    def from_text(cls, text: str, path: str = "<string>"):
+        return cls(path, text.encode("utf-8"))
+
+    def __len__(self):
+        return len(self.data)
+
+    def text(self, start: int = 0, end: int | None = None) -> str:
+        # decodes straight out of the mmap, no intermediate bytes copy
+        return str(self.view[start:end], "utf-8", "replace")
+
+    def line_col(self, offset: int) -> tuple[int, int]:
+        line = bisect_right(self.line_starts, offset)
+        line_start = self.line_starts[line - 1]
+        return line, len(self.text(line_start, offset)) + 1
+
+    def describe(self, offset: int) -> str:
+        line, col = self.line_col(offset)
+        return f"{self.path}:{line}:{col}"
+
+    def close(self):
+        self.view.release()
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
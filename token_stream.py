@@ -0,0 +1,605 @@
+import re
+from array import array
+from bisect import bisect_right
+from Token import Token, TokenType
+from fast_lexer import chunks, FIXED_TOKENS, IDENT_START, DIGITS, WHITESPACE, CHUNK_SIZE
+from source_file import SourceFile
+
+
+TOKEN_TYPES: list[TokenType] = list(TokenType)
+TYPE_CODES: dict[TokenType, int] = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+FIXED_CODES: dict[str, int] = {literal: TYPE_CODES[type_] for literal, (type_, _) in FIXED_TOKENS.items()}
+
+C_EOF = TYPE_CODES[TokenType.EOF]
+C_UNKNOWN = TYPE_CODES[TokenType.UNKNOWN]
+C_IDENTIFIER = TYPE_CODES[TokenType.IDENTIFIER]
+C_INT = TYPE_CODES[TokenType.INT]
+C_FLOAT = TYPE_CODES[TokenType.FLOAT]
+C_STRING = TYPE_CODES[TokenType.STRING]
+C_LBRACE = TYPE_CODES[TokenType.LBRACE]
+C_RBRACE = TYPE_CODES[TokenType.RBRACE]
+
+# non ascii chars that are tokens on their own (🤙), identifiers must not swallow them
+GLUED_CHARS = b"|".join(re.escape(ch.encode("utf-8")) for ch in FIXED_TOKENS if len(ch) == 1 and not ch.isascii())
+
+# same token shapes as fast_lexer.TOKEN_RE but over utf-8 bytes, every non ascii char is
+# matched whole and identifiers swallow other non ascii runs that the scanner then double checks
+BYTES_TOKEN_RE = re.compile(rb"""
+      [ \t\r\n]++
+    | B--(?:[\xc0-\xff][\x80-\xbf]*+|.)?
+    | [A-Za-z_](?:[A-Za-z0-9_]++|(?!""" + GLUED_CHARS + rb""")[\x80-\xff][\x80-\xbf]*+)*+
+    | [-+*/<>=!]=|->|&&|\|\||<<|>>
+    | [0-9]++(?:\.[0-9]*+)?+
+    | "[^"]*+"?+
+    | [\xc0-\xff][\x80-\xbf]*+
+    | .
+""", re.VERBOSE | re.DOTALL)
+
+FIXED_BYTE_CODES: dict[bytes, int] = {literal.encode("utf-8"): code for literal, code in FIXED_CODES.items()}
+IDENT_START_BYTES = frozenset(ord(ch) for ch in IDENT_START)
+DIGIT_BYTES = frozenset(ord(ch) for ch in DIGITS)
+WHITESPACE_BYTES = frozenset(ord(ch) for ch in WHITESPACE)
+QUOTE = ord('"')
+QUOTES = ('"', QUOTE)
+
+# tokens starting with one of these report their end as place, the rest their last char
+WORD_START = IDENT_START | DIGITS | IDENT_START_BYTES | DIGIT_BYTES
+ARROW_START = frozenset(('B', ord('B')))
+SPECIAL_CODES = frozenset((C_EOF, C_STRING, C_INT, C_FLOAT))
+
+# relex lexes this many chars at a time while looking for the old tokens again
+RELEX_CHUNK_SIZE = 256
+# tokens are kept in pieces of about this many, an edit rewrites the pieces it lands in and
+# only bumps three numbers for every piece behind it
+PIECE_SIZE = 1024
+MAX_PIECE = 2 * PIECE_SIZE
+MIN_PIECE = PIECE_SIZE // 4
+
+
+class TokenStream():
+    """
+    The whole token stream of a source as parallel arrays: a type code, start and
+    end offset and row per token, roughly 13 bytes a token. Literals and Token
+    objects are only built when somebody asks for them. The last entry is always
+    the EOF token.
+
+    The arrays are cut into pieces of about PIECE_SIZE tokens. Every piece has an
+    offset and a row shift that gets added on read, so an edit moves everything
+    behind it by bumping the shift of each piece instead of touching its tokens.
+
+    Given a str, offsets are code points and the tokens match Lexer exactly. Given
+    a SourceFile it lexes the utf-8 bytes in place and offsets are byte offsets.
+    """
+    def __init__(self, source: str | SourceFile):
+        self.source = source
+        # what offsets index into, the str itself or the raw bytes of the file
+        self.__data = source.data if isinstance(source, SourceFile) else source
+
+        types: array = array('B')
+        starts: array = array('I')
+        ends: array = array('I')
+        rows: array = array('I')
+        if isinstance(source, SourceFile):
+            self.__scan_bytes(types, starts, ends, rows)
+        else:
+            self.__scan(types, starts, ends, rows)
+
+        # (types, starts, ends, rows) per piece, the index of its first token and what gets
+        # added to its offsets and rows
+        self.__pieces: list[tuple[array, array, array, array]] = []
+        self.__firsts: list[int] = []
+        self.__shifts: list[int] = []
+        self.__row_shifts: list[int] = []
+        self.__last_piece = 0
+        self.__count = len(types)
+        for first in range(0, self.__count, PIECE_SIZE):
+            piece_end = first + PIECE_SIZE
+            self.__pieces.append((types[first:piece_end], starts[first:piece_end], ends[first:piece_end], rows[first:piece_end]))
+            self.__firsts.append(first)
+            self.__shifts.append(0)
+            self.__row_shifts.append(0)
+
+    def __scan(self, types: array, starts: array, ends: array, rows: array):
+        source = self.source
+        line_no = 1
+        eof_place = len(source)
+        for pos, tokens in chunks(source):
+            pos, line_no, eof_place = self.__lex_chunk(source, pos, tokens, line_no, eof_place, types, starts, ends, rows)
+
+        types.append(C_EOF)
+        starts.append(eof_place)
+        ends.append(eof_place)
+        rows.append(line_no)
+
+    @staticmethod
+    def __lex_chunk(source: str, pos: int, tokens: list[str], line_no: int, eof_place: int,
+                    types: array, starts: array, ends: array, rows: array) -> tuple[int, int, int]:
+        # turns one chunk of literals into codes and appends them, gives back the lexer state
+        fixed = FIXED_CODES
+        ident_start = IDENT_START
+        digits = DIGITS
+        whitespace = WHITESPACE
+        add_type = types.append
+        add_start = starts.append
+        add_end = ends.append
+        add_row = rows.append
+
+        for literal in tokens:
+            start = pos
+            pos += len(literal)
+
+            code = fixed.get(literal)
+            if code is None:
+                ch = literal[0]
+                if ch in whitespace:
+                    line_no += literal.count('\n')
+                    continue
+                elif ch in ident_start:
+                    code = C_IDENTIFIER
+                    if start + 4 > eof_place and literal.startswith('B--'):
+                        eof_place = start + 4
+                elif ch in digits:
+                    if source.startswith('.', pos):
+                        print(f"That shit is NOT a number at line {line_no} place {pos}")
+                        code = C_UNKNOWN
+                    elif '.' in literal:
+                        code = C_FLOAT
+                    else:
+                        code = C_INT
+                elif ch == '"':
+                    code = C_STRING
+                    if len(literal) == 1 or literal[-1] != '"':
+                        eof_place = pos + 1
+                else:
+                    code = C_UNKNOWN
+
+            add_type(code)
+            add_start(start)
+            add_end(pos)
+            add_row(line_no)
+
+        return pos, line_no, eof_place
+
+    def __scan_bytes(self, types: array, starts: array, ends: array, rows: array):
+        data = self.source.data
+        length = len(data)
+        fixed = FIXED_BYTE_CODES
+        ident_start = IDENT_START_BYTES
+        digits = DIGIT_BYTES
+        whitespace = WHITESPACE_BYTES
+        add_type = types.append
+        add_start = starts.append
+        add_end = ends.append
+        add_row = rows.append
+        line_no = 1
+        eof_place = length
+
+        pos = 0
+        chunk_size = CHUNK_SIZE
+        while pos < length:
+            stop = data.find(b'\n', pos + chunk_size)
+            chunk_size = CHUNK_SIZE
+            stop = length if stop == -1 else stop + 1
+            tokens = BYTES_TOKEN_RE.findall(data, pos, stop)
+            while stop < length and tokens[-1][0] == QUOTE and (len(tokens[-1]) == 1 or tokens[-1][-1] != QUOTE):
+                close = data.find(b'"', stop)
+                stop = data.find(b'\n', close) if close != -1 else -1
+                stop = length if stop == -1 else stop + 1
+                tokens = BYTES_TOKEN_RE.findall(data, pos, stop)
+
+            for literal in tokens:
+                start = pos
+                pos += len(literal)
+
+                code = fixed.get(literal)
+                if code is None:
+                    ch = literal[0]
+                    if ch in whitespace:
+                        line_no += literal.count(b'\n')
+                        continue
+                    elif ch in ident_start:
+                        code = C_IDENTIFIER
+                        if not literal.isascii() and not literal.startswith(b'B--'):
+                            cut = self.__ident_length(literal)
+                            if cut < len(literal):
+                                # some other non word char is glued on, lex the rest of the line again
+                                pos = start + cut
+                                stop = pos
+                                chunk_size = 0
+                                code = fixed.get(literal[:cut], C_IDENTIFIER)
+                        if pos - start < 4 and start + 4 > eof_place and literal.startswith(b'B--'):
+                            eof_place = start + 4
+                    elif ch in digits:
+                        if data[pos:pos + 1] == b'.':
+                            print(f"That shit is NOT a number at {self.source.describe(pos)}")
+                            code = C_UNKNOWN
+                        elif b'.' in literal:
+                            code = C_FLOAT
+                        else:
+                            code = C_INT
+                    elif ch == QUOTE:
+                        code = C_STRING
+                        if len(literal) == 1 or literal[-1] != QUOTE:
+                            eof_place = pos + 1
+                    else:
+                        code = C_UNKNOWN
+
+                add_type(code)
+                add_start(start)
+                add_end(pos)
+                add_row(line_no)
+                if pos == stop:
+                    break
+            pos = stop
+
+        add_type(C_EOF)
+        add_start(eof_place)
+        add_end(eof_place)
+        add_row(line_no)
+
+    @staticmethod
+    def __ident_length(literal: bytes) -> int:
+        # how many bytes of the literal the str lexer would take as one identifier
+        text = literal.decode("utf-8", "surrogateescape")
+        n = 1
+        while n < len(text) and (text[n].isalnum() or text[n] == '_'):
+            n += 1
+        return len(text[:n].encode("utf-8", "surrogateescape"))
+
+    def __len__(self):
+        return self.__count
+
+    def __locate(self, index: int) -> tuple[int, int]:
+        # which piece the token is in and where in it
+        if index < 0:
+            index += self.__count
+        piece = bisect_right(self.__firsts, index) - 1
+        return piece, index - self.__firsts[piece]
+
+    def __code_at(self, index: int) -> int:
+        piece, i = self.__locate(index)
+        return self.__pieces[piece][0][i]
+
+    def type_at(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.__code_at(index)]
+
+    def start_at(self, index: int) -> int:
+        piece, i = self.__locate(index)
+        return self.__pieces[piece][1][i] + self.__shifts[piece]
+
+    def end_at(self, index: int) -> int:
+        piece, i = self.__locate(index)
+        return self.__pieces[piece][2][i] + self.__shifts[piece]
+
+    def row_at(self, index: int) -> int:
+        piece, i = self.__locate(index)
+        return self.__pieces[piece][3][i] + self.__row_shifts[piece]
+
+    def __text(self, start: int, end: int) -> str:
+        if self.__data is self.source:
+            return self.source[start:end]
+        return self.source.text(start, end)
+
+    def text_at(self, index: int) -> str:
+        return self.__text(self.start_at(index), self.end_at(index))
+
+    def place_at(self, index: int) -> int:
+        piece, i = self.__locate(index)
+        types, starts, ends, _ = self.__pieces[piece]
+        shift = self.__shifts[piece]
+        return self.__place(types[i], starts[i] + shift, ends[i] + shift)
+
+    def __place(self, code: int, start: int, end: int) -> int:
+        # same place the char by char Lexer reports, it is not always the start
+        if code == C_EOF:
+            return start
+        data = self.__data
+        if code == C_STRING:
+            closed = end - start > 1 and data[end - 1] in QUOTES
+            return end - 1 if closed else end
+        ch = data[start]
+        if ch in WORD_START:
+            return max(end, start + 4) if ch in ARROW_START and data[start:start + 3] in ('B--', b'B--') else end
+        return end - 1
+
+    def literal_at(self, index: int):
+        piece, i = self.__locate(index)
+        types, starts, ends, _ = self.__pieces[piece]
+        shift = self.__shifts[piece]
+        return self.__literal(types[i], starts[i] + shift, ends[i] + shift)
+
+    def __literal(self, code: int, start: int, end: int):
+        if code == C_EOF:
+            return ""
+        if code == C_STRING:
+            return self.__text(start + 1, self.__place(code, start, end))
+        text = self.__text(start, end)
+        if code == C_INT:
+            return int(text)
+        if code == C_FLOAT:
+            return float(text)
+        return text
+
+    def token_at(self, index: int) -> Token:
+        # the parser asks for the tokens in order, so the piece of the last one is the best guess
+        piece = self.__last_piece
+        i = index - self.__firsts[piece]
+        types, starts, ends, rows = self.__pieces[piece]
+        if not 0 <= i < len(types):
+            piece, i = self.__locate(index)
+            self.__last_piece = piece
+            types, starts, ends, rows = self.__pieces[piece]
+        code = types[i]
+        shift = self.__shifts[piece]
+        start = starts[i] + shift
+        end = ends[i] + shift
+        row = rows[i] + self.__row_shifts[piece]
+        if code in SPECIAL_CODES:
+            return Token(TOKEN_TYPES[code], self.__literal(code, start, end), row, self.__place(code, start, end))
+
+        # keywords, operators, identifiers and junk, the literal is just the text (hot path for the parser)
+        ch = self.__data[start]
+        if ch not in WORD_START:
+            end_place = end - 1
+        elif ch in ARROW_START:
+            end_place = self.__place(code, start, end)
+        else:
+            end_place = end
+        return Token(TOKEN_TYPES[code], self.__text(start, end), row, end_place)
+
+    def __first_end_after(self, offset: int, lo: int, hi: int) -> int:
+        # first index in [lo, hi) whose token ends after offset, hi if there is none
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.end_at(mid) > offset:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def relex(self, offset: int, removed: int, inserted: str, new_source: str | None = None):
+        """
+        Applies an edit (replace removed chars at offset with inserted) to a str stream
+        in place and returns it. Only re-lexes from a few chars in front of the edit
+        until the new tokens line up with the old ones again, everything behind that
+        is spliced back as is, so the cost depends on the edit and not on the file.
+        An editor that already has the edited text can pass it as new_source and skip
+        the copy, on big files gluing the str together is most of the time.
+        """
+        if self.__data is not self.source:
+            raise ValueError("only token streams over a str can be re-lexed, not over a SourceFile")
+        old = self.source
+        if offset < 0 or removed < 0 or offset + removed > len(old):
+            raise ValueError(f"edit at {offset} removing {removed} chars is outside the source of {len(old)} chars")
+
+        source = old[:offset] + inserted + old[offset + removed:] if new_source is None else new_source
+        delta = len(inserted) - removed
+        last = self.__count - 1
+
+        # nothing ending 3+ chars before the edit could have seen it, two char ops and numbers
+        # look one char ahead and B-- three, so restart after the token in front of those
+        restart = self.__first_end_after(offset - 3, 0, last)
+        if restart > 0:
+            pos = self.end_at(restart - 1)
+            line_no = self.row_at(restart - 1)
+        else:
+            pos = 0
+            line_no = 1
+        eof_place = len(source)
+
+        types = array('B')
+        starts = array('I')
+        ends = array('I')
+        rows = array('I')
+        # old tokens behind the edit are candidates to line up with
+        old_edit_end = offset + removed
+        new_edit_end = offset + len(inserted)
+        j = restart
+        while j < last and self.start_at(j) < old_edit_end:
+            j += 1
+        checked = 0
+        synced = False
+
+        for pos, tokens in chunks(source, pos, RELEX_CHUNK_SIZE):
+            pos, line_no, eof_place = self.__lex_chunk(source, pos, tokens, line_no, eof_place, types, starts, ends, rows)
+            for k in range(checked, len(types)):
+                start = starts[k]
+                if start < new_edit_end:
+                    continue
+                while j < last and self.start_at(j) < start - delta:
+                    j += 1
+                if j == last:
+                    break
+                if self.start_at(j) == start - delta and self.__code_at(j) == types[k] and self.end_at(j) == ends[k] - delta:
+                    synced = True
+                    row_delta = rows[k] - self.row_at(j)
+                    del types[k:], starts[k:], ends[k:], rows[k:]
+                    break
+            if synced or j == last:
+                break
+            checked = len(types)
+
+        if not synced:
+            # nothing left to line up with, lex whatever is left and the new EOF replaces the old one
+            for pos, tokens in chunks(source, pos):
+                pos, line_no, eof_place = self.__lex_chunk(source, pos, tokens, line_no, eof_place, types, starts, ends, rows)
+            types.append(C_EOF)
+            starts.append(eof_place)
+            ends.append(eof_place)
+            rows.append(line_no)
+            j = last + 1
+
+        self.__splice(restart, j, types, starts, ends, rows, delta, row_delta if synced else 0)
+        self.source = source
+        self.__data = source
+        return self
+
+    def __splice(self, head: int, tail: int, types: array, starts: array, ends: array, rows: array, delta: int, row_delta: int):
+        """
+        Replaces the tokens in [head, tail) with the new ones and moves everything from
+        tail on by delta chars and row_delta rows. Only the pieces head and tail are in
+        get rebuilt, the ones behind them just get their shifts bumped, so the cost is
+        the edit plus a few pieces, no matter where the last edit was.
+        """
+        pieces = self.__pieces
+        firsts = self.__firsts
+        shifts = self.__shifts
+        row_shifts = self.__row_shifts
+        first, i = self.__locate(head)
+        if tail < self.__count:
+            last, k = self.__locate(tail)
+        else:
+            last, k = len(pieces) - 1, len(pieces[-1][0])
+
+        # what's left of the first piece in front of the edit with the new tokens glued on, in that
+        # piece's shifts, and what's left of the last piece behind it, which keeps its stored values
+        old_types, old_starts, old_ends, old_rows = pieces[first]
+        shift, row_shift = (shifts[first], row_shifts[first]) if i > 0 else (0, 0)
+        front = (old_types[:i], old_starts[:i], old_ends[:i], old_rows[:i])
+        self.__extend(front, (types, starts, ends, rows), -shift, -row_shift)
+        old_types, old_starts, old_ends, old_rows = pieces[last]
+        back = (old_types[k:], old_starts[k:], old_ends[k:], old_rows[k:])
+        back_shift, back_row_shift = shifts[last] + delta, row_shifts[last] + row_delta
+
+        new_pieces: list[tuple[array, array, array, array]] = []
+        new_shifts: list[int] = []
+        new_row_shifts: list[int] = []
+        if len(back[0]) < MIN_PIECE:
+            # a few tokens aren't worth a piece of their own, moving them over to the front costs about as much
+            self.__extend(front, back, back_shift - shift, back_row_shift - row_shift)
+            back = None
+        start_piece = first
+        if len(front[0]) < MIN_PIECE and first > 0 and len(pieces[first - 1][0]) + len(front[0]) <= MAX_PIECE:
+            # same for a small front, it goes on the end of the piece before
+            start_piece = first - 1
+            prev = pieces[start_piece]
+            self.__extend(prev, front, shift - shifts[start_piece], row_shift - row_shifts[start_piece])
+            front = prev
+            shift, row_shift = shifts[start_piece], row_shifts[start_piece]
+        for piece_start in range(0, len(front[0]), PIECE_SIZE):
+            # the rest goes in one piece once it's small enough, a big insert gets cut up
+            piece_end = len(front[0]) if len(front[0]) - piece_start < MAX_PIECE else piece_start + PIECE_SIZE
+            new_pieces.append(tuple(column[piece_start:piece_end] for column in front))
+            new_shifts.append(shift)
+            new_row_shifts.append(row_shift)
+            if piece_end == len(front[0]):
+                break
+        if back is not None and len(back[0]) > 0:
+            new_pieces.append(back)
+            new_shifts.append(back_shift)
+            new_row_shifts.append(back_row_shift)
+
+        new_firsts: list[int] = []
+        index = firsts[start_piece]
+        for piece in new_pieces:
+            new_firsts.append(index)
+            index += len(piece[0])
+        moved = len(types) - (tail - head)
+        pieces[start_piece:last + 1] = new_pieces
+        firsts[start_piece:last + 1] = new_firsts
+        shifts[start_piece:last + 1] = new_shifts
+        row_shifts[start_piece:last + 1] = new_row_shifts
+        behind = start_piece + len(new_pieces)
+        if moved:
+            firsts[behind:] = [first_index + moved for first_index in firsts[behind:]]
+        if delta:
+            shifts[behind:] = [shift + delta for shift in shifts[behind:]]
+        if row_delta:
+            row_shifts[behind:] = [row_shift + row_delta for row_shift in row_shifts[behind:]]
+        self.__count += moved
+        self.__last_piece = start_piece
+
+    @staticmethod
+    def __extend(piece: tuple[array, array, array, array], tokens: tuple[array, array, array, array], shift: int, row_shift: int):
+        # appends tokens to piece with shift added to their offsets and row_shift to their rows
+        types, starts, ends, rows = piece
+        types.extend(tokens[0])
+        if shift:
+            starts.extend([start + shift for start in tokens[1]])
+            ends.extend([end + shift for end in tokens[2]])
+        else:
+            starts.extend(tokens[1])
+            ends.extend(tokens[2])
+        if row_shift:
+            rows.extend([row + row_shift for row in tokens[3]])
+        else:
+            rows.extend(tokens[3])
+
+    def closing_brace(self, index: int) -> int:
+        # index of the } closing the first { at or after index, -1 if it never closes
+        if index >= self.__count:
+            return -1
+        first, i = self.__locate(index)
+        depth = 0
+        for piece in range(first, len(self.__pieces)):
+            types = self.__pieces[piece][0]
+            n = len(types)
+            open_ = close = -1
+            while True:
+                if open_ < i:
+                    open_ = self.__find(types, C_LBRACE, i)
+                if close < i:
+                    close = self.__find(types, C_RBRACE, i)
+                if depth == 0:
+                    if open_ == n:
+                        break
+                    depth = 1
+                    i = open_ + 1
+                elif open_ < close:
+                    depth += 1
+                    i = open_ + 1
+                elif close < n:
+                    depth -= 1
+                    if depth == 0:
+                        return self.__firsts[piece] + close
+                    i = close + 1
+                else:
+                    break
+            i = 0
+        return -1
+
+    @staticmethod
+    def __find(types: array, code: int, start: int) -> int:
+        # index of the first code at or after start, len(types) if there is none
+        try:
+            return types.index(code, start)
+        except ValueError:
+            return len(types)
+
+    def span(self, first: int, last: int) -> bytes:
+        # raw source bytes from the start of token first to the end of token last
+        start = self.start_at(first)
+        end = self.end_at(last)
+        if self.__data is self.source:
+            return self.source[start:end].encode("utf-8", "surrogatepass")
+        return self.source.view[start:end].tobytes()
+
+    def cursor(self, index: int = 0):
+        return TokenCursor(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.token_at(i)
+
+
+class TokenCursor():
+    """
+    Walks a TokenStream and hands out Tokens one at a time, so it can be given to
+    Parser instead of a lexer. Past the end it keeps returning EOF like Lexer does.
+    """
+    def __init__(self, stream: TokenStream, index: int = 0):
+        self.stream = stream
+        self.source = stream.source
+        self.source_file: SourceFile | None = stream.source if isinstance(stream.source, SourceFile) else None
+        self.index = index
+
+    def next_token(self) -> Token:
+        index = self.index
+        self.index += 1
+        last = len(self.stream) - 1
+        if index < last:
+            return self.stream.token_at(index)
+        return Token(TokenType.EOF, "", self.stream.row_at(last), self.stream.start_at(last) + index - last)
+
+    def seek(self, index: int):
+        self.index = index